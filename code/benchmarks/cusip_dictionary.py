@@ -0,0 +1,93 @@
+"""
+Compare dictionary CUSIP matching with the anchor-first extractor on large plain text filings.
+
+Usage: python code/benchmarks/cusip_dictionary.py [documents] [rows per document]
+       python code/benchmarks/cusip_dictionary.py --corpus <directory of .htm/.html/.txt documents>
+
+Synthetic filings are 13F-style information tables whose CUSIPs come from data/dictionaries, with the
+word CUSIP only in the column header. The dictionaries are compiled into .cache/lookup on first use.
+"""
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fixtures
+from lookup import Lookup
+
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cusip_utils = load_module(os.path.join(os.path.dirname(__file__), '..', 'cik-cusips', 'utils.py'), 'cusip_utils')
+
+
+def dictionary_cusips(path='data/dictionaries/sc13dg_cusips.txt'):
+    with open(path) as f:
+        return [line.strip() for line in f if cusip_utils.is_valid_cusip(line.strip())]
+
+
+def load_corpus(directory):
+    documents = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in ['.htm', '.html', '.txt']:
+                with open(os.path.join(root, name), 'rb') as f:
+                    documents.append((f.read(), None))
+    return documents
+
+
+def run(extractor, contents):
+    found = []
+    start = time.perf_counter()
+    for content in contents:
+        found.append({item['cusip'].upper() for item in extractor(content)})
+    return found, time.perf_counter() - start
+
+
+def compare(documents, lookup):
+    raw = [content if isinstance(content, bytes) else content.encode() for content, _ in documents]
+    text = [content.decode('utf-8', errors='replace') for content in raw]
+    megabytes = sum(len(content) for content in raw) / 1e6
+
+    def dictionary(content):
+        return cusip_utils.find_cusips_dictionary(content, lookup.known_cusips)
+
+    anchored, anchored_seconds = run(cusip_utils.find_cusips_html, text)
+    from_text, text_seconds = run(dictionary, text)
+    from_bytes, bytes_seconds = run(dictionary, raw)
+
+    results = {
+        'documents': len(documents),
+        'megabytes': round(megabytes, 2),
+        'anchored_mb_per_second': round(megabytes / anchored_seconds, 2),
+        'dictionary_text_mb_per_second': round(megabytes / text_seconds, 2),
+        'dictionary_bytes_mb_per_second': round(megabytes / bytes_seconds, 2),
+        'anchored_cusips': sum(len(found) for found in anchored),
+        'dictionary_cusips': sum(len(found) for found in from_bytes),
+        'text_and_bytes_identical': from_text == from_bytes,
+        'missed_anchored_cusips': sum(len(a - d) for a, d in zip(anchored, from_bytes)),
+    }
+    if all(expected is not None for _, expected in documents):
+        results['expected_cusips'] = sum(len(expected) for _, expected in documents)
+        results['anchored_recall'] = round(sum(len(found & expected) for found, (_, expected) in zip(anchored, documents))
+                                           / results['expected_cusips'], 4)
+        results['dictionary_recall'] = round(sum(len(found & expected) for found, (_, expected) in zip(from_bytes, documents))
+                                             / results['expected_cusips'], 4)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == '--corpus':
+        documents = load_corpus(sys.argv[2])
+    else:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        documents = fixtures.holdings_documents(n, dictionary_cusips(), rows=rows)
+    for key, value in compare(documents, Lookup()).items():
+        print(f"{key}: {value}")
@@ -0,0 +1,74 @@
+"""
+Compare the legacy backtracking CUSIP regex with the anchor-first extractor in code/cik-cusips/utils.py.
+
+Usage: python code/benchmarks/cusip_extraction.py <directory of .htm/.html/.txt 13D/G documents>
+"""
+import importlib.util
+import os
+import re
+import sys
+import time
+
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cusip_utils = load_module(os.path.join(os.path.dirname(__file__), '..', 'cik-cusips', 'utils.py'), 'cusip_utils')
+
+
+def find_cusips_html_legacy(text, distance=20):
+    pattern = rf'(CUSIP.{{0,{distance}}}\b([0-9A-HJ-NP-Z]{{8}}[0-9])\b|\b([0-9A-HJ-NP-Z]{{8}}[0-9])\b.{{0,{distance}}}CUSIP)'
+    results = []
+    for m in re.finditer(pattern, text, re.DOTALL):
+        cusip_id = m.group(2) if m.group(2) else m.group(3)
+        results.append({'cusip': cusip_id, 'index': m.start() + m.group().find(cusip_id)})
+    return results
+
+
+def load_corpus(directory):
+    documents = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in ['.htm', '.html', '.txt']:
+                with open(os.path.join(root, name), encoding='utf-8', errors='replace') as f:
+                    documents.append((os.path.join(root, name), f.read()))
+    return documents
+
+
+def run(extractor, documents):
+    found = set()
+    start = time.perf_counter()
+    for path, text in documents:
+        for item in extractor(text):
+            found.add((path, item['cusip']))
+    return found, time.perf_counter() - start
+
+
+def compare(documents):
+    megabytes = sum(len(text) for _, text in documents) / 1e6
+    legacy, legacy_seconds = run(find_cusips_html_legacy, documents)
+    anchored, anchored_seconds = run(cusip_utils.find_cusips_html, documents)
+    legacy_valid = {item for item in legacy if cusip_utils.is_valid_cusip(item[1])}
+
+    return {
+        'documents': len(documents),
+        'megabytes': round(megabytes, 2),
+        'legacy_mb_per_second': round(megabytes / legacy_seconds, 2),
+        'anchored_mb_per_second': round(megabytes / anchored_seconds, 2),
+        'speedup': round(legacy_seconds / anchored_seconds, 2),
+        'legacy_cusips': len(legacy),
+        'legacy_invalid_check_digit': len(legacy - legacy_valid),
+        'anchored_cusips': len(anchored),
+        'missed_valid_legacy_cusips': len(legacy_valid - anchored),
+        'new_cusips': len(anchored - legacy),
+    }
+
+
+if __name__ == "__main__":
+    documents = load_corpus(sys.argv[1])
+    for key, value in compare(documents).items():
+        print(f"{key}: {value}")
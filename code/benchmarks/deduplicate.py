@@ -0,0 +1,113 @@
+"""
+Benchmark deduplicate_and_merge on synthetic N-PX identifier rows.
+
+Usage: python code/benchmarks/deduplicate.py [rows] [legacy_limit]
+
+Rows are drawn from rows / 20 securities, each identifier missing 10% of the time, so most securities repeat
+across filings and some only connect through a shared identifier. The legacy dict-per-row implementation is
+run too, and checked for identical output, when rows <= legacy_limit (default 1,000,000).
+"""
+import importlib.util
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+fsi_utils = load_module(os.path.join(os.path.dirname(__file__), '..', 'financial-security-identifiers', 'utils.py'), 'fsi_utils')
+
+
+def deduplicate_and_merge_legacy(rows):
+    """The original implementation: a dict per row, list indices and a recursive find."""
+    parent = list(range(len(rows)))
+    rank = [0] * len(rows)
+
+    def find(x):
+        if parent[x] != x:
+            parent[x] = find(parent[x])
+        return parent[x]
+
+    def union(x, y):
+        px, py = find(x), find(y)
+        if px == py:
+            return
+        if rank[px] < rank[py]:
+            px, py = py, px
+        parent[py] = px
+        if rank[px] == rank[py]:
+            rank[px] += 1
+
+    indices = {identifier: defaultdict(list) for identifier in fsi_utils.IDENTIFIERS}
+    for i, row in enumerate(rows):
+        for identifier in fsi_utils.IDENTIFIERS:
+            if row.get(identifier):
+                indices[identifier][row[identifier]].append(i)
+    for identifier in fsi_utils.IDENTIFIERS:
+        for row_indices in indices[identifier].values():
+            for idx in row_indices[1:]:
+                union(row_indices[0], idx)
+
+    groups = defaultdict(list)
+    for i in range(len(rows)):
+        groups[find(i)].append(i)
+
+    final_rows = []
+    for group_indices in groups.values():
+        merged = {}
+        for idx in group_indices:
+            for identifier in fsi_utils.IDENTIFIERS:
+                if rows[idx].get(identifier) and identifier not in merged:
+                    merged[identifier] = rows[idx][identifier]
+        if len(merged) >= 2:
+            final_rows.append(merged)
+    return final_rows
+
+
+def synthetic_columns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    securities = rng.integers(0, max(1, n // 20), n)
+    columns = {
+        'cusip': np.char.zfill(securities.astype(str), 9),
+        'isin': np.char.add('US', np.char.zfill(securities.astype(str), 10)),
+        'figi': np.char.add('BBG', np.char.zfill(securities.astype(str), 9)),
+    }
+    for identifier in fsi_utils.IDENTIFIERS:
+        columns[identifier][rng.random(n) < 0.1] = ''
+    return columns
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    legacy_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+
+    columns = synthetic_columns(n)
+    print(f"rows: {n}")
+
+    start = time.perf_counter()
+    merged = fsi_utils.deduplicate_and_merge_columns(columns)
+    columnar_seconds = time.perf_counter() - start
+    print(f"columnar: {columnar_seconds:.2f}s, {len(merged['cusip'])} securities, peak RSS {peak_rss_mb():.0f} MB")
+
+    if n <= legacy_limit:
+        rows = [{identifier: str(columns[identifier][i]) for identifier in fsi_utils.IDENTIFIERS if columns[identifier][i]}
+                for i in range(n)]
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), n + 1000))
+        start = time.perf_counter()
+        legacy = deduplicate_and_merge_legacy(rows)
+        legacy_seconds = time.perf_counter() - start
+        print(f"legacy: {legacy_seconds:.2f}s, {len(legacy)} securities, speedup {legacy_seconds / columnar_seconds:.1f}x")
+        print(f"identical output: {legacy == fsi_utils.deduplicate_and_merge(rows)}")
@@ -0,0 +1,262 @@
+"""
+Synthetic, deterministic fixtures for the benchmark harness: full-text search hits served by a local stub of the
+EFTS endpoint, SC 13D/G documents with embedded CUSIPs, and N-PX identifier rows with controlled overlap.
+
+Every generator takes a seed, so a given scale always produces the same data and benchmarks can be compared
+offline across commits.
+"""
+import json
+import random
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ALPHABET = '0123456789ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+
+def _check_digit(payload):
+    """Modulus 10 "double add double" check digit, shared by CUSIP and FIGI."""
+    total = 0
+    for i, char in enumerate(payload):
+        value = int(char) if char.isdigit() else ord(char) - ord('A') + 10
+        if i % 2 == 1:
+            value *= 2
+        total += value // 10 + value % 10
+    return str((10 - total % 10) % 10)
+
+
+def _luhn_digit(payload):
+    digits = ''.join(str(int(char, 36)) for char in payload)
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if i % 2 == 0 else 1)
+        total += value // 10 + value % 10
+    return str((10 - total % 10) % 10)
+
+
+def make_cusip(rng):
+    base = ''.join(rng.choice(ALPHABET) for _ in range(8))
+    return base + _check_digit(base)
+
+
+def isin_for(cusip, country='US'):
+    payload = country + cusip
+    return payload + _luhn_digit(payload)
+
+
+def make_figi(rng):
+    # Third character G, and no vowels, as in real FIGIs
+    consonants = '0123456789BCDFGHJKLMNPQRSTVWXYZ'
+    payload = 'BBG' + ''.join(rng.choice(consonants) for _ in range(8))
+    return payload + _check_digit(payload)
+
+
+# Full-text search
+
+def efts_hits(text_query, start_date, end_date, hits_per_day=20, forms=('8-K',), seed=0):
+    """
+    Hits for a query over an inclusive date range, in the EFTS response format. The same (query, day) always
+    yields the same hits, so overlapping windows return overlapping results like the real endpoint.
+    """
+    hits = []
+    day = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    while day <= end:
+        rng = random.Random(f'{seed}:{text_query}:{day.isoformat()}')
+        for i in range(hits_per_day):
+            filer = rng.randrange(1, 2_000_000)
+            accession = f'{filer:010d}-{day.year % 100:02d}-{rng.randrange(1, 1_000_000):06d}'
+            ciks = [f'{rng.randrange(1, 2_000_000):010d}' for _ in range(rng.choice((1, 1, 1, 2)))]
+            hits.append({
+                '_id': f'{accession}:ex99-{i}.htm',
+                '_source': {'file_date': day.isoformat(), 'ciks': ciks, 'form': rng.choice(forms)},
+            })
+        day += timedelta(days=1)
+    return hits
+
+
+class EftsStub:
+    """
+    Local stand-in for https://efts.sec.gov/LATEST/search-index, paging synthetic hits by from/size.
+    Only days between first_date and last_date have hits, so a search running up to today always returns
+    the same results.
+
+    Usage:
+        with EftsStub('2024-01-01', '2024-03-31') as stub:
+            search(query, filing_date=(start, end), base_url=stub.base_url)
+    """
+    def __init__(self, first_date, last_date, hits_per_day=20, forms=('8-K',), seed=0):
+        self.first_date = first_date
+        self.last_date = last_date
+        self.hits_per_day = hits_per_day
+        self.forms = forms
+        self.seed = seed
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                start_date = max(params['startdt'], stub.first_date)
+                end_date = min(params['enddt'], stub.last_date)
+                hits = efts_hits(params.get('q', ''), start_date, end_date, stub.hits_per_day, stub.forms, stub.seed)
+                start = int(params.get('from', 0))
+                size = int(params.get('size', 100))
+                buckets = {}
+                for hit in hits:
+                    buckets[hit['_source']['form']] = buckets.get(hit['_source']['form'], 0) + 1
+                body = json.dumps({
+                    'hits': {'total': {'value': len(hits)}, 'hits': hits[start:start + size]},
+                    'aggregations': {'form_filter': {
+                        'buckets': [{'key': form, 'doc_count': n} for form, n in buckets.items()],
+                        'sum_other_doc_count': 0}},
+                }).encode()
+                with stub.lock:
+                    stub.requests += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/LATEST/search-index'
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def mention_rows(n, seed=0, start_date='2020-01-01'):
+    """Mention CSV rows (filing_date, cik, accession_number, filename), spread over about five years."""
+    rng = random.Random(seed)
+    first = date.fromisoformat(start_date)
+    rows = []
+    for _ in range(n):
+        day = first + timedelta(days=rng.randrange(5 * 365))
+        accession = f'{rng.randrange(1, 2_000_000):010d}-{day.year % 100:02d}-{rng.randrange(1, 1_000_000):06d}'
+        rows.append([day.isoformat(), str(rng.randrange(1, 2_000_000)), accession, 'ex99.htm'])
+    return rows
+
+
+# SC 13D/G documents
+
+FILLER = ('The Reporting Persons beneficially own the shares reported herein and have sole voting power over '
+          'such shares. Item 4 describes the purpose of the transaction in 2024. ')
+
+
+def schedule_documents(n, paragraphs=40, seed=0):
+    """
+    Synthetic SC 13D/G documents as (extension, text, expected CUSIPs). Each carries one issuer CUSIP next to
+    the word CUSIP, written in one of the formats seen in filings, plus CUSIP-shaped decoys far from any anchor.
+    """
+    rng = random.Random(seed)
+    documents = []
+    for i in range(n):
+        cusip = make_cusip(rng)
+        decoy = make_cusip(rng)
+        kind = i % 3
+        if kind == 2:
+            text = ('<?xml version="1.0"?><edgarSubmission><formData><coverPageHeader>'
+                    f'<issuerInfo><issuerCUSIP>{cusip}</issuerCUSIP></issuerInfo>'
+                    '</coverPageHeader></formData></edgarSubmission>')
+            documents.append(('.xml', text, {cusip}))
+            continue
+        cover = rng.choice([f'CUSIP No. {cusip}', f'(CUSIP Number)</p><p>{cusip}', f'{cusip}<br>(CUSIP Number)'])
+        body = [FILLER] * paragraphs
+        body[rng.randrange(paragraphs)] = f'Reference number {decoy} appears in an exhibit. ' + FILLER
+        if kind == 0:
+            text = '<html><body><p>SCHEDULE 13D</p><p>' + cover + '</p>' + \
+                   ''.join(f'<p>{paragraph}</p>' for paragraph in body) + '</body></html>'
+            documents.append(('.htm', text, {cusip}))
+        else:
+            text = 'SCHEDULE 13G\n\n' + cover.replace('</p><p>', '\n').replace('<br>', '\n') + '\n\n' + '\n'.join(body)
+            documents.append(('.txt', text, {cusip}))
+    return documents
+
+
+def holdings_documents(n, cusips, rows=500, seed=0):
+    """
+    Large plain text filings holding tables of securities, like 13F-HR information tables: the word CUSIP
+    only appears in the column header, and about one row in ten prints its CUSIP in 6-2-1 groups.
+
+    Returns:
+        List of (text, set of CUSIPs in the table)
+    """
+    rng = random.Random(seed)
+    header = f"{'NAME OF ISSUER':<32}{'TITLE OF CLASS':<16}{'CUSIP':<13}{'VALUE':>10}{'SHARES':>12}  SH/PRN\n"
+    documents = []
+    for _ in range(n):
+        lines = ['FORM 13F INFORMATION TABLE\n', header]
+        expected = set()
+        for _ in range(rows):
+            cusip = rng.choice(cusips)
+            expected.add(cusip)
+            printed = f'{cusip[:6]} {cusip[6:8]} {cusip[8]}' if rng.random() < 0.1 else cusip
+            name = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ ') for _ in range(24))
+            lines.append(f"{name:<32}{'COM':<16}{printed:<13}{rng.randrange(1, 10**7):>10}"
+                         f"{rng.randrange(1, 10**8):>12}  SH\n")
+        documents.append((''.join(lines), expected))
+    return documents
+
+
+# N-PX identifiers
+
+def npx_rows(n, securities=None, missing=0.1, invalid=0.01, seed=0):
+    """
+    N-PX proxy voting rows as dictionaries of cusip/isin/figi, as extract_fidi produces them.
+
+    Rows are drawn from securities distinct securities (n // 20 by default), so most repeat across filings.
+    Each identifier is missing with probability missing, and corrupted (wrong check digit) with probability
+    invalid. Rows keep only present identifiers, and at least two of them, like extract_fidi.
+    """
+    rng = random.Random(seed)
+    securities = securities or max(1, n // 20)
+    universe = []
+    for _ in range(securities):
+        cusip = make_cusip(rng)
+        universe.append({'cusip': cusip, 'isin': isin_for(cusip), 'figi': make_figi(rng)})
+
+    rows = []
+    while len(rows) < n:
+        security = universe[rng.randrange(securities)]
+        row = {}
+        for identifier, value in security.items():
+            if rng.random() < missing:
+                continue
+            if rng.random() < invalid:
+                value = value[:-1] + str((int(value[-1]) + 1) % 10)
+            row[identifier] = value
+        if len(row) >= 2:
+            rows.append(row)
+    return rows
+
+
+def chain_rows(n, seed=0):
+    """
+    N-PX rows forming one long chain of securities: each row shares its CUSIP with one neighbour and its
+    ISIN with the other, so merging them needs about n steps of label propagation. Rows are shuffled, so
+    the chain does not follow row order.
+    """
+    rng = random.Random(seed)
+    cusips = [make_cusip(rng) for _ in range(n // 2 + 1)]
+    rows = [{'cusip': cusips[(i + 1) // 2], 'isin': isin_for(cusips[i // 2])} for i in range(n)]
+    rng.shuffle(rows)
+    return rows
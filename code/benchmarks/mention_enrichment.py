@@ -0,0 +1,86 @@
+"""
+Benchmark joining every mention file to the filer metadata in a single pass.
+
+Usage: python code/benchmarks/mention_enrichment.py [mentions_dir]
+
+All mention CSVs under mentions_dir (default data/mentions) are read into one table and joined with
+enrichment.enrich. The same join is then done the way consumers do it by hand, with a dict of dicts per CIK
+and a scan of each company's name history per row, and the two are checked for identical output.
+"""
+import csv
+import glob
+import gzip
+import os
+import resource
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import enrichment
+from columnar import to_table
+from mentionstore import iter_rows
+
+
+def enrich_dicts(rows):
+    """Dict of dicts join: metadata by CIK, and a linear scan of the name history for each row."""
+    with gzip.open(enrichment.METADATA_FILENAME, 'rt', newline='') as f:
+        metadata = {int(row['cik']): row for row in csv.DictReader(f)}
+    history = {}
+    with gzip.open(enrichment.NAMES_FILENAME, 'rt', newline='') as f:
+        for row in csv.DictReader(f):
+            history.setdefault(int(row['cik']), []).append((row['start_date'], row['name']))
+    for names in history.values():
+        names.sort()
+
+    enriched = []
+    for filing_date, cik, _, _ in rows:
+        cik = int(cik)
+        name = None
+        names = history.get(cik)
+        if names:
+            name = names[0][1]
+            for start_date, candidate in names:
+                if start_date <= filing_date:
+                    name = candidate
+        filer = metadata.get(cik)
+        enriched.append({
+            'name': name,
+            'tickers': enrichment._parse_list(filer['tickers']) if filer else None,
+            'sic': int(filer['sic']) if filer and filer['sic'].isdigit() else None,
+            'sic_description': (filer['sicDescription'] or None) if filer else None,
+            'listed': filer is not None,
+        })
+    return enriched
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    mentions_dir = sys.argv[1] if len(sys.argv) > 1 else 'data/mentions'
+    paths = sorted(glob.glob(os.path.join(mentions_dir, '*', '*', '*.csv.gz')))
+
+    start = time.perf_counter()
+    rows = [row for path in paths for row in iter_rows(path)]
+    table = to_table(rows)
+    print(f"read {len(rows)} rows from {len(paths)} files in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    filers = enrichment.FilerTable()
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    enriched = enrichment.enrich(table, filers)
+    join_seconds = time.perf_counter() - start
+    print(f"arrays: load {load_seconds:.2f}s, join {join_seconds:.2f}s "
+          f"({len(rows) / join_seconds:,.0f} rows/s), peak RSS {peak_rss_mb():.0f} MB")
+
+    # to_table sorts by filing date, so compare against the dict join over the same order
+    sorted_rows = sorted(rows, key=lambda row: row[0])
+    start = time.perf_counter()
+    expected = enrich_dicts(sorted_rows)
+    dict_seconds = time.perf_counter() - start
+    print(f"dicts: {dict_seconds:.2f}s, speedup {dict_seconds / (load_seconds + join_seconds):.1f}x")
+
+    fields = [field for field, _ in enrichment.ENRICHED_FIELDS]
+    print(f"identical output: {enriched.select(fields).to_pylist() == expected}")
@@ -0,0 +1,346 @@
+"""
+Benchmark the data-building hot paths on synthetic fixtures, with no network access.
+
+Usage: python code/benchmarks/run.py [--scale N] [--repeat N] [--stage NAME ...]
+                                     [--save [PATH]] [--compare [PATH]] [--threshold FRACTION]
+
+Each stage runs in a fresh process that builds the fixtures itself, so stages never inherit each other's
+memory. A stage is timed as the best of --repeat runs, then run once more under tracemalloc for its peak Python
+allocation; peak_rss_mb is how far the process's resident set grew above its size once the fixtures were built.
+--save writes the results as a baseline (code/benchmarks/baseline.json by default); --compare checks the results
+against a baseline taken at the same scale and exits with status 1 when a stage got slower, or used more memory,
+by more than --threshold (default 0.25).
+"""
+import argparse
+import gc
+import multiprocessing
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fixtures
+import mentionstore
+from instrumentation import peak_rss_mb
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Smallest change still reported as a regression, since tiny stages are dominated by noise
+MIN_DELTA = {'seconds': 0.01, 'peak_alloc_mb': 1.0, 'peak_rss_mb': 10.0}
+
+# Fixture sizes at --scale 1
+SIZES = {
+    'search_days': 60,
+    'hits_per_day': 20,
+    'mention_rows': 100_000,
+    'append_batch': 10_000,
+    'documents': 2000,
+    'holdings': 20,
+    'npx_rows': 50_000,
+    'union_find': 200_000,
+    'chain_rows': 200_000,
+}
+
+
+def load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+cusip_utils = load_module(os.path.join(code_dir, 'cik-cusips', 'utils.py'), 'cusip_utils')
+fsi_utils = load_module(os.path.join(code_dir, 'financial-security-identifiers', 'utils.py'), 'fsi_utils')
+
+
+# Stages. Each takes the fixtures and returns the number of items it processed.
+
+def stage_construct_mentions(data):
+    """Two runs over the stub: the first appends every hit, the second finds them all already present."""
+    from mentions import construct_mentions
+    from textsearch import TokenBucket
+
+    # The stub needs no rate limiting, so the timing measures parsing, dedup and appends
+    limiter = TokenBucket(rate=1e6, capacity=1e6, max_rate=1e6)
+    directory = tempfile.mkdtemp()
+    mentionstore.SIDECAR_DIR = os.path.join(directory, 'sidecars')
+    try:
+        file_path = os.path.join(directory, 'mentions.csv')
+        with fixtures.EftsStub(data['search_start'], data['search_end'], data['hits_per_day']) as stub:
+            first = construct_mentions(['"benchmark"'], file_path, start_date=data['search_start'],
+                                       limiter=limiter, base_url=stub.base_url)
+            second = construct_mentions(['"benchmark"'], file_path, start_date=data['search_start'],
+                                        limiter=limiter, base_url=stub.base_url)
+        if second:
+            raise AssertionError(f"Second run appended {len(second)} duplicate rows")
+        return len(first)
+    finally:
+        shutil.rmtree(directory)
+
+
+def stage_mentionstore(data):
+    """Append rows in batches, then check every key against the memory-mapped key index."""
+    directory = tempfile.mkdtemp()
+    mentionstore.SIDECAR_DIR = os.path.join(directory, 'sidecars')
+    try:
+        file_path = os.path.join(directory, 'mentions.csv.gz')
+        rows = data['mention_rows']
+        batch = data['append_batch']
+        for start in range(0, len(rows), batch):
+            mentionstore.append_rows(file_path, rows[start:start + batch])
+        keys = mentionstore.load_keys(file_path)
+        try:
+            missing = sum(1 for row in rows if tuple(row[:3]) not in keys)
+        finally:
+            keys.close()
+        if missing:
+            raise AssertionError(f"{missing} appended keys missing from the key index")
+        return len(rows)
+    finally:
+        shutil.rmtree(directory)
+
+
+def stage_find_cusips_html(data):
+    found = 0
+    for extension, text, expected in data['documents']:
+        if extension != '.xml':
+            cusips = {item['cusip'] for item in cusip_utils.find_cusips_html(text)}
+            if cusips != expected:
+                raise AssertionError(f"Expected {expected}, found {cusips}")
+            found += len(cusips)
+    return found
+
+
+def stage_find_cusips_xml(data):
+    found = 0
+    for extension, text, expected in data['documents']:
+        if extension == '.xml':
+            cusips = {item['cusip'].upper() for item in cusip_utils.find_cusips_xml(text)}
+            if cusips != expected:
+                raise AssertionError(f"Expected {expected}, found {cusips}")
+            found += len(cusips)
+    return found
+
+
+def stage_find_cusips_bytes(data):
+    found = 0
+    for extension, text, expected in data['documents']:
+        cusips = {item['cusip'].upper() for item in cusip_utils.find_cusips_bytes(text.encode(), extension)[0]}
+        if cusips != expected:
+            raise AssertionError(f"Expected {expected}, found {cusips}")
+        found += len(cusips)
+    return found
+
+
+def stage_find_cusips_dictionary(data):
+    known = data['holdings_cusips']
+    found = 0
+    for text, expected in data['holdings']:
+        cusips = {item['cusip'] for item in
+                  cusip_utils.find_cusips_dictionary(text.encode(), lambda values: [value in known for value in values])}
+        if not expected <= cusips:
+            raise AssertionError(f"Missed {len(expected - cusips)} dictionary CUSIPs")
+        found += len(cusips)
+    return found
+
+
+def stage_validate_identifiers(data):
+    return len(fsi_utils.validate_identifiers(data['npx_rows']))
+
+
+def stage_validate_check_digits(data):
+    return len(fsi_utils.validate_check_digits(data['validated_rows'])[0])
+
+
+def stage_deduplicate_and_merge(data):
+    fsi_utils.deduplicate_and_merge(data['checked_rows'])
+    return len(data['checked_rows'])
+
+
+def stage_deduplicate_chain(data):
+    merged = fsi_utils.deduplicate_and_merge(data['chain_rows'])
+    if len(merged) != 1:
+        raise AssertionError(f"Chain merged into {len(merged)} securities, not 1")
+    return len(data['chain_rows'])
+
+
+def stage_union_find(data):
+    pairs = data['union_pairs']
+    union_find = fsi_utils.UnionFind(data['union_size'])
+    for x, y in pairs:
+        union_find.union(x, y)
+    union_find.get_groups()
+    return len(pairs)
+
+
+STAGES = {
+    'construct_mentions': stage_construct_mentions,
+    'mentionstore': stage_mentionstore,
+    'find_cusips_html': stage_find_cusips_html,
+    'find_cusips_xml': stage_find_cusips_xml,
+    'find_cusips_bytes': stage_find_cusips_bytes,
+    'find_cusips_dictionary': stage_find_cusips_dictionary,
+    'validate_identifiers': stage_validate_identifiers,
+    'validate_check_digits': stage_validate_check_digits,
+    'deduplicate_and_merge': stage_deduplicate_and_merge,
+    'deduplicate_chain': stage_deduplicate_chain,
+    'union_find': stage_union_find,
+}
+
+
+def build_fixtures(scale, seed=0):
+    sizes = {name: max(1, int(size * scale)) for name, size in SIZES.items()}
+    search_start = date(2024, 1, 1)
+    search_end = search_start + timedelta(days=sizes['search_days'] - 1)
+
+    npx_rows = fixtures.npx_rows(sizes['npx_rows'], seed=seed)
+    validated_rows = fsi_utils.validate_identifiers(npx_rows)
+    checked_rows = fsi_utils.validate_check_digits(validated_rows)[0]
+
+    rng = random.Random(seed)
+    holdings_cusips = [fixtures.make_cusip(rng) for _ in range(5000)]
+    n = sizes['union_find']
+    return {
+        'search_start': search_start.isoformat(),
+        'search_end': search_end.isoformat(),
+        'hits_per_day': SIZES['hits_per_day'],
+        'mention_rows': fixtures.mention_rows(sizes['mention_rows'], seed=seed),
+        'append_batch': SIZES['append_batch'],
+        'documents': fixtures.schedule_documents(sizes['documents'], seed=seed),
+        'holdings_cusips': set(holdings_cusips),
+        'holdings': fixtures.holdings_documents(sizes['holdings'], holdings_cusips, seed=seed),
+        'npx_rows': npx_rows,
+        'validated_rows': validated_rows,
+        'checked_rows': checked_rows,
+        'chain_rows': fixtures.chain_rows(sizes['chain_rows'], seed=seed),
+        'union_size': n,
+        # Mostly local unions with some long-range ones, so groups chain across the whole range
+        'union_pairs': [(rng.randrange(n), rng.randrange(n)) if i % 10 == 0 else (i, min(n - 1, i + rng.randrange(1, 50)))
+                        for i in range(n)],
+    }
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size of this process to its current size, where the kernel allows it."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def measure(stage, data, repeat):
+    """Best wall time of repeat runs, plus the peak traced allocation of one extra run."""
+    times = []
+    items = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = stage(data)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stage(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    seconds = min(times)
+    return {
+        'seconds': round(seconds, 4),
+        'items': items,
+        'items_per_second': round(items / seconds, 1) if seconds else None,
+        'peak_alloc_mb': round(peak / 1e6, 2),
+    }
+
+
+def measure_stage(name, scale, repeat):
+    """Build the fixtures and measure one stage; meant to run in a fresh process."""
+    data = build_fixtures(scale)
+    gc.collect()
+    reset_peak_rss()
+    rss_before = peak_rss_mb()['self']
+    results = measure(STAGES[name], data, repeat)
+    results['peak_rss_mb'] = round(peak_rss_mb()['self'] - rss_before, 1)
+    return results
+
+
+def run(scale=1.0, repeat=3, stages=None):
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in stages or STAGES:
+        if name == 'construct_mentions' and importlib.util.find_spec('datamule') is None:
+            results[name] = {'skipped': 'datamule is not installed'}
+            print(f"{name}: skipped, datamule is not installed")
+            continue
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(measure_stage, name, scale, repeat).result()
+        print(f"{name}: {results[name]['seconds']:.4f}s, {results[name]['items']} items, "
+              f"peak {results[name]['peak_alloc_mb']} MB allocated, RSS +{results[name]['peak_rss_mb']} MB")
+    return {
+        'scale': scale,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'date': time.strftime("%Y-%m-%d"),
+        'stages': results,
+    }
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Stages that regressed against a baseline.
+
+    Returns:
+        List of (stage, metric, baseline value, current value)
+    """
+    if results['scale'] != baseline['scale']:
+        raise SystemExit(f"Baseline was taken at scale {baseline['scale']}, not {results['scale']}")
+    regressions = []
+    for name, current in results['stages'].items():
+        previous = baseline['stages'].get(name)
+        if not previous or 'skipped' in previous or 'skipped' in current:
+            continue
+        for metric, min_delta in MIN_DELTA.items():
+            if current[metric] > previous[metric] * (1 + threshold) and current[metric] - previous[metric] > min_delta:
+                regressions.append((name, metric, previous[metric], current[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data-building hot paths on synthetic fixtures")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplier for every fixture size")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage, the best is kept")
+    parser.add_argument('--stage', action='append', choices=list(STAGES), help="Only run these stages")
+    parser.add_argument('--save', nargs='?', const=BASELINE_PATH, help="Write the results as a baseline")
+    parser.add_argument('--compare', nargs='?', const=BASELINE_PATH, help="Compare against a baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    results = run(args.scale, args.repeat, args.stage)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, previous, current in regressions:
+            print(f"REGRESSION {name} {metric}: {previous} -> {current}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
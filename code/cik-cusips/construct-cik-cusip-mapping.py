@@ -1,32 +1,88 @@
 from datamule import Portfolio
-from utils import find_cusips_html, find_cusips_xml
+from utils import find_cusips_bytes, find_cusips_dictionary
 import csv
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
 import gzip
 import os
+import shutil
+import sys
+import tempfile
 
-# Create datasets directory if it doesn't exist
-os.makedirs('data/datasets', exist_ok=True)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from checkdigits import cusip_mask
+from instrumentation import Recorder, count, recorder, span, write_report
+from lookup import Lookup, compile_all
+from manifest import update_manifest
 
-portfolio = Portfolio('schedules-for-cusips')
+SUBMISSION_TYPES = ['SC 13D','SC 13D/A',
+                    'SC 13G','SC 13G/A',
+                    'SCHEDULE 13D','SCHEDULE 13D/A',
+                    'SCHEDULE 13G','SCHEDULE 13G/A']
 
-rows = []
-fail_count = 0
+OUTPUT_FILENAME = 'data/datasets/cik_cusip_crosswalk.csv.gz'
+HEADER = ['accession_number', 'filing_date', 'issuer_cik', 'cusip']
 
-current_year = datetime.now().year
-for year in range(1995, current_year + 1):
-    print(f"Processing Year: {year}")
-    portfolio.download_submissions(submission_type=['SC 13D','SC 13D/A',
-                                                    'SC 13G','SC 13G/A',
-                                                    'SCHEDULE 13D','SCHEDULE 13D/A',
-                                                    'SCHEDULE 13G','SCHEDULE 13G/A'],
-                                                    filing_date=(f'{year}-01-01',f'{year}-12-31'),
-                                    document_type=['SC 13D','SC 13D/A',
-                                                    'SC 13G','SC 13G/A',
-                                                    'SCHEDULE 13D','SCHEDULE 13D/A',
-                                                    'SCHEDULE 13G','SCHEDULE 13G/A'],
-                                                    provider='datamule')
+# Months are downloaded, scanned and written on separate processes, each with its own portfolio
+MAX_WORKERS = int(os.environ.get('CUSIP_MAX_WORKERS', 4))
 
+# Also match every CUSIP listed in data/dictionaries, including ones printed without the word "CUSIP" nearby
+DICTIONARY_SCAN = os.environ.get('CUSIP_DICTIONARY_SCAN', '') not in ('', '0')
+
+
+def get_month_ranges(start_date, end_date):
+    """Split a date range into (start, end) calendar month ranges in YYYY-MM-DD format"""
+    months = []
+    current = start_date
+    while current <= end_date:
+        next_month = (current.replace(day=1) + timedelta(days=32)).replace(day=1)
+        month_end = min(end_date, next_month - timedelta(days=1))
+        months.append((current.strftime('%Y-%m-%d'), month_end.strftime('%Y-%m-%d')))
+        current = next_month
+    return months
+
+
+def read_last_filing_date(filename):
+    """
+    Stream the existing crosswalk to find its latest filing date.
+
+    Returns:
+        (latest filing date, set of accession numbers filed on that date), or (None, set()) if there is no crosswalk
+    """
+    if not os.path.exists(filename):
+        return None, set()
+
+    last_date = None
+    accessions = set()
+    with gzip.open(filename, 'rt', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+        for accession, filing_date, _, _ in reader:
+            if last_date is None or filing_date > last_date:
+                last_date = filing_date
+                accessions = {accession}
+            elif filing_date == last_date:
+                accessions.add(accession)
+    return last_date, accessions
+
+
+def extract_rows(portfolio, skip_accessions, contains=None, counter=count):
+    """
+    Scan every submission of a downloaded portfolio for CUSIPs.
+
+    Documents are searched as raw bytes: those without the word "CUSIP" are skipped without being decoded,
+    and only windows around each occurrence are decoded and scanned.
+
+    Args:
+        contains: Dictionary membership function; when given, text documents are also scanned for every
+            known CUSIP with find_cusips_dictionary
+        counter: Records the documents and bytes the prefilter skipped, e.g. a worker's Recorder.count
+
+    Returns:
+        (list of (accession, filing date, issuer cik, cusip) rows, failure count)
+    """
+    rows = []
+    fail_count = 0
     for sub in portfolio:
         try:
             accession = sub.metadata.content['accession-number']
@@ -39,39 +95,159 @@ for year in range(1995, current_year + 1):
             if isinstance(filing_date,list):
                 filing_date = filing_date[0]
 
+            # already in the crosswalk from the previous run
+            if accession in skip_accessions:
+                continue
+
             subject_companies = sub.metadata.content['subject-company']
-            
+
             # handles when company names change
             if not isinstance(subject_companies, list):
                 subject_companies = [subject_companies]
-            
+
             issuer_cik = subject_companies[0]['company-data']['cik']
 
             sub_cusips = []
             for doc in sub:
-                if doc.extension == '.xml':
-                    sub_cusips.extend(find_cusips_xml(doc.content.decode()))
-                elif doc.extension in ['.htm','.html','.txt']:
-                    sub_cusips.extend(find_cusips_html(doc.text))
+                if doc.extension not in ['.xml','.htm','.html','.txt']:
+                    continue
+                content = doc.content if isinstance(doc.content, bytes) else doc.content.encode('utf-8')
+                found, decoded = find_cusips_bytes(content, doc.extension)
+                sub_cusips.extend(found)
+                counter('cusip_documents')
+                counter('cusip_document_bytes', len(content))
+                counter('cusip_bytes_saved', len(content) - decoded)
+                if not decoded:
+                    counter('cusip_documents_skipped')
+                if contains is not None and doc.extension != '.xml':
+                    sub_cusips.extend(find_cusips_dictionary(content, contains))
 
-            unique_cusips = list(set([item['cusip'] for item in sub_cusips]))
+            unique_cusips = list(set([item['cusip'].upper() for item in sub_cusips]))
             for cusip in unique_cusips:
-                rows.append((accession,filing_date,issuer_cik,cusip.upper()))
+                rows.append((accession,filing_date,issuer_cik,cusip))
 
         except Exception as e:
             fail_count+=1
             print(f"Fail count {fail_count}: {e}")
-	
+
+    return rows, fail_count
+
+
+def process_month(start_date, end_date, shard_path, skip_accessions, dictionary_scan=DICTIONARY_SCAN):
+    """
+    Download one month of SC 13D/G submissions and write its CIK-CUSIP rows to a headerless gzip shard.
+    CUSIPs are check digit validated as one batch per month before being written.
+
+    Returns:
+        (row count, failure count, rejection counts, exported spans of this month)
+    """
+    # Runs in a worker process, so the month is recorded separately and handed back to the parent
+    month = Recorder()
+    print(f"Processing: {start_date} to {end_date}")
+    with month.span('download', month=start_date):
+        portfolio = Portfolio(f'schedules-for-cusips-{start_date}')
+        portfolio.download_submissions(submission_type=SUBMISSION_TYPES,
+                                       filing_date=(start_date, end_date),
+                                       document_type=SUBMISSION_TYPES,
+                                       provider='datamule')
+
+    # The dictionaries are compiled by the parent, so workers only memory-map them
+    contains = Lookup(compile=False).known_cusips if dictionary_scan else None
+    with month.span('extract', month=start_date):
+        rows, fail_count = extract_rows(portfolio, skip_accessions, contains, counter=month.count)
+
     portfolio.delete()
 
+    with month.span('write_shard', month=start_date, rows=len(rows)):
+        valid, rejections = cusip_mask([row[3] for row in rows])
+        with gzip.open(shard_path, 'wt', newline='') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+            writer.writerows(row for row, ok in zip(rows, valid) if ok)
+
+    return int(valid.sum()), fail_count, rejections, month.export()
+
+
+def build_crosswalk(output_filename=OUTPUT_FILENAME, max_workers=MAX_WORKERS):
+    """
+    Build or extend the CIK-CUSIP crosswalk.
+
+    With an existing crosswalk only filings from its latest filing date onwards are processed, and the new
+    rows are appended as gzip members. Without one, every month since 1995 is processed.
+    """
+    last_date, skip_accessions = read_last_filing_date(output_filename)
+    if last_date is None:
+        start_date = date(1995, 1, 1)
+        print("No existing crosswalk, rebuilding from 1995")
+    else:
+        # Submission metadata stores filing dates as YYYYMMDD
+        start_date = datetime.strptime(last_date.replace('-', ''), '%Y%m%d').date()
+        print(f"Extending crosswalk from {last_date}")
+
+    months = get_month_ranges(start_date, date.today())
+    if DICTIONARY_SCAN:
+        compile_all()
+    shard_dir = tempfile.mkdtemp(prefix='cik-cusip-shards-')
+    shard_paths = [os.path.join(shard_dir, f'{month_start}.csv.gz') for month_start, _ in months]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_month, month_start, month_end, shard_path, skip_accessions)
+                   for (month_start, month_end), shard_path in zip(months, shard_paths)]
+
+        # Assemble shards in month order. Appending stops at the first failed month, so the next run
+        # picks up from there instead of leaving a gap behind the latest filing date.
+        tmp_filename = output_filename + '.tmp'
+        if last_date is None:
+            with gzip.open(tmp_filename, 'wt', newline='') as csvfile:
+                csv.writer(csvfile, quoting=csv.QUOTE_ALL).writerow(HEADER)
+        else:
+            shutil.copyfile(output_filename, tmp_filename)
+
+        total_rows = 0
+        total_failures = 0
+        total_rejections = {}
+        with open(tmp_filename, 'ab') as output:
+            for (month_start, _), future, shard_path in zip(months, futures, shard_paths):
+                try:
+                    row_count, fail_count, rejections, spans = future.result()
+                except Exception as e:
+                    print(f"Month {month_start} failed, stopping here: {e}")
+                    count('failed_months')
+                    executor.shutdown(cancel_futures=True)
+                    break
+                recorder.merge(spans)
+                with span('append', month=month_start), open(shard_path, 'rb') as shard:
+                    shutil.copyfileobj(shard, output)
+                os.remove(shard_path)
+                count('months')
+                count('rows', row_count)
+                count('failures', fail_count)
+                count('rejected_cusips', sum(rejections.values()))
+                total_rows += row_count
+                total_failures += fail_count
+                for rule, rule_count in rejections.items():
+                    total_rejections[rule] = total_rejections.get(rule, 0) + rule_count
+                print(f"Month {month_start}: {row_count} rows, {fail_count} failures, {sum(rejections.values())} rejected CUSIPs")
+
+    os.replace(tmp_filename, output_filename)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+    print(f"CIK-CUSIP mapping data written to: {output_filename}")
+    try:
+        with span('manifest'):
+            changes = update_manifest()
+        count('changed_outputs', len(changes))
+        print(f"Manifest: {len(changes)} outputs changed")
+    except Exception as e:
+        print(f"Manifest: {e}")
+    print(f"New rows: {total_rows}")
+    print(f"Total failures: {total_failures}")
+    for rule, rule_count in total_rejections.items():
+        print(f"Rejected by {rule}: {rule_count}")
 
-output_filename = f'data/datasets/cik_cusip_crosswalk.csv.gz'
+    write_report('construct-cik-cusip-mapping', extra={'start_date': str(start_date), 'rejections': total_rejections})
 
-with gzip.open(output_filename, 'wt', newline='') as csvfile:
-    writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
-    writer.writerow(['accession_number', 'filing_date', 'issuer_cik', 'cusip'])
-    writer.writerows(rows)
 
-print(f"CIK-CUSIP mapping data written to: {output_filename}")
-print(f"Total rows: {len(rows)}")
-print(f"Total failures: {fail_count}")
\ No newline at end of file
+if __name__ == "__main__":
+    # Create datasets directory if it doesn't exist
+    os.makedirs('data/datasets', exist_ok=True)
+    build_crosswalk()
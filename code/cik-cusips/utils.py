@@ -1,21 +1,64 @@
+import html
 import re
 
+CUSIP_ANCHOR = re.compile('cusip', re.IGNORECASE)
+CUSIP_TOKEN = re.compile(r'\b[0-9A-HJ-NP-Z]{8}[0-9]\b')
+CUSIP_SPECIAL_VALUES = {'*': 36, '@': 37, '#': 38}
+
+# CUSIP-shaped tokens for dictionary matching, also when printed in 6-2-1 groups such as "037833 10 0".
+# The issue number may hold the *, @ and # of private placement CUSIPs.
+CUSIP_CANDIDATE = r'\b[0-9A-Z]{6}[ -]?[0-9A-Z*@#]{2}[ -]?[0-9]\b'
+CUSIP_CANDIDATE_TEXT = re.compile(CUSIP_CANDIDATE)
+CUSIP_CANDIDATE_BYTES = re.compile(CUSIP_CANDIDATE.encode())
+
+# Raw bytes decoded either side of each "cusip" in a document. Generous, since markup between the label and
+# the identifier takes up bytes but not text.
+WINDOW_RADIUS = 4096
+HTML_TAG = re.compile(r'<[^>]*>')
+WHITESPACE = re.compile(r'\s+')
+
+
+def cusip_check_digit(base):
+    """Compute the modulus 10 "double add double" check digit for the first 8 characters of a CUSIP."""
+    total = 0
+    for i, char in enumerate(base.upper()):
+        if char.isdigit():
+            value = int(char)
+        elif 'A' <= char <= 'Z':
+            value = ord(char) - ord('A') + 10
+        else:
+            value = CUSIP_SPECIAL_VALUES[char]
+        if i % 2 == 1:
+            value *= 2
+        total += value // 10 + value % 10
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_cusip(cusip):
+    return len(cusip) == 9 and cusip[8] == cusip_check_digit(cusip[:8])
+
+
 def find_cusips_html(text, distance=20):
-    # Use f-string to inject the distance parameter into the regex
-    pattern = rf'(CUSIP.{{0,{distance}}}\b([0-9A-HJ-NP-Z]{{8}}[0-9])\b|\b([0-9A-HJ-NP-Z]{{8}}[0-9])\b.{{0,{distance}}}CUSIP)'
-    
+    """
+    Find CUSIPs printed near the word "CUSIP" (any case).
+
+    Only windows around each anchor are scanned: an identifier may start up to distance characters after
+    the anchor, or end up to distance characters before it. Identifiers with a wrong check digit are dropped.
+    """
     results = []
-    for m in re.finditer(pattern, text, re.DOTALL):
-        # Group 2 = CUSIP identifier when "CUSIP" comes first
-        # Group 3 = CUSIP identifier when "CUSIP" comes after
-        cusip_id = m.group(2) if m.group(2) else m.group(3)
-        
-        # Find the actual start position of the CUSIP identifier within the match
-        cusip_start_in_match = m.group().find(cusip_id)
-        cusip_index = m.start() + cusip_start_in_match
-        
-        results.append({'cusip': cusip_id, 'index': cusip_index})
-    
+    seen = set()
+    for anchor in CUSIP_ANCHOR.finditer(text):
+        window_start = max(0, anchor.start() - distance - 9)
+        # One extra character so the word boundary after an identifier is checked against real text
+        window_end = anchor.end() + distance + 9 + 1
+        for m in CUSIP_TOKEN.finditer(text, window_start, window_end):
+            before = 0 <= anchor.start() - m.end() <= distance
+            after = 0 <= m.start() - anchor.end() <= distance
+            if (before or after) and m.start() not in seen and is_valid_cusip(m.group()):
+                seen.add(m.start())
+                results.append({'cusip': m.group(), 'index': m.start()})
+
+    results.sort(key=lambda item: item['index'])
     return results
 
 import re
@@ -29,4 +72,82 @@ def find_cusips_xml(xml_content):
         cusip = m.group(1)
         results.append({'cusip': cusip, 'index': m.start(1)})
     
-    return results
\ No newline at end of file
+    return results
+
+
+def find_cusips_dictionary(content, contains):
+    """
+    Find every known CUSIP in a document, whether or not the word "CUSIP" is nearby, e.g. in holdings tables.
+
+    A single pass collects CUSIP-shaped tokens, which are then checked against the dictionary in one batch.
+    Check digits are not recomputed here: dictionary entries were seen in filings, and callers building
+    datasets validate every row in bulk with checkdigits.cusip_mask.
+
+    Args:
+        content: Document text, or raw bytes (indexes are then byte offsets)
+        contains: Function mapping a list of candidate CUSIPs to one boolean each, e.g. Lookup.known_cusips
+            over the compiled data/dictionaries lists
+
+    Returns:
+        List of {'cusip', 'index'} dictionaries, in document order
+    """
+    if isinstance(content, bytes):
+        matches = [(m.start(), m.group().decode('ascii')) for m in CUSIP_CANDIDATE_BYTES.finditer(content)]
+    else:
+        matches = [(m.start(), m.group()) for m in CUSIP_CANDIDATE_TEXT.finditer(content)]
+    if not matches:
+        return []
+
+    # Tokens printed in 6-2-1 groups are matched without their separators
+    cusips = [token if len(token) == 9 else token.replace(' ', '').replace('-', '') for _, token in matches]
+    known = contains(cusips)
+    return [{'cusip': cusip, 'index': index} for (index, _), cusip, hit in zip(matches, cusips, known) if hit]
+
+
+def cusip_windows(content, radius=WINDOW_RADIUS):
+    """
+    Byte ranges of a document around every case-insensitive "cusip", merged where they overlap.
+    An empty list means the document cannot hold a CUSIP for find_cusips_html or find_cusips_xml.
+    """
+    # Lowering the bytes once and using bytes.find is several times faster than a case-insensitive regex
+    lowered = content.lower()
+    windows = []
+    position = lowered.find(b'cusip')
+    while position != -1:
+        start, end = max(0, position - radius), min(len(content), position + 5 + radius)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+        position = lowered.find(b'cusip', position + 5)
+    return windows
+
+
+def window_text(window, extension):
+    """Decode a window of raw bytes, reducing html to its text so label and identifier end up close together."""
+    text = window.decode('utf-8', errors='replace')
+    if extension in ['.htm', '.html']:
+        text = html.unescape(HTML_TAG.sub(' ', text))
+    return WHITESPACE.sub(' ', text)
+
+
+def find_cusips_bytes(content, extension, radius=WINDOW_RADIUS):
+    """
+    Find CUSIPs in a raw document, decoding only windows around the word "CUSIP".
+
+    Uses find_cusips_xml for .xml documents and find_cusips_html otherwise. Indexes are the byte offsets of
+    the windows the CUSIPs were found in.
+
+    Returns:
+        (list of {'cusip', 'index'} dictionaries, number of bytes decoded)
+    """
+    results = []
+    decoded = 0
+    for start, end in cusip_windows(content, radius):
+        decoded += end - start
+        if extension == '.xml':
+            found = find_cusips_xml(content[start:end].decode('utf-8', errors='replace'))
+        else:
+            found = find_cusips_html(window_text(content[start:end], extension))
+        results.extend({'cusip': item['cusip'], 'index': start} for item in found)
+    return results, decoded
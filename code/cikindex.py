@@ -0,0 +1,290 @@
+import glob
+import json
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+from keyindex import pack_accession, pack_date, unpack_accession, unpack_date
+from mentionstore import load_state
+from rollups import load_records
+
+INDEX_DIR = 'data/cik_index'
+MENTIONS_DIR = 'data/mentions'
+
+# One fixed-width entry per CIK, sorted by cik, pointing at its postings
+DIRECTORY_DTYPE = np.dtype([('cik', '<u4'), ('count', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+
+# Postings of a CIK are grouped by mention key id. Each group is varint(key id), varint(posting count),
+# then per posting varint(days since the previous posting's date) and varint(packed accession).
+
+
+def _paths(index_dir):
+    return (os.path.join(index_dir, 'directory.bin'),
+            os.path.join(index_dir, 'postings.bin'),
+            os.path.join(index_dir, 'meta.json'))
+
+
+def mention_files(mentions_dir=MENTIONS_DIR):
+    """Map each mention key to its .csv.gz file."""
+    return {os.path.basename(path)[:-len('.csv.gz')]: path
+            for path in sorted(glob.glob(os.path.join(mentions_dir, '*', '*', '*.csv.gz')))}
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode_postings(postings):
+    """Encode (key id, days, accession) tuples of one CIK. Returns (bytes, posting count)."""
+    postings = sorted(set(postings))
+    out = bytearray()
+    i = 0
+    while i < len(postings):
+        key_id = postings[i][0]
+        j = i
+        while j < len(postings) and postings[j][0] == key_id:
+            j += 1
+        _write_varint(out, key_id)
+        _write_varint(out, j - i)
+        previous = 0
+        for _, days, accession in postings[i:j]:
+            _write_varint(out, days - previous)
+            _write_varint(out, accession)
+            previous = days
+        i = j
+    return bytes(out), len(postings)
+
+
+def decode_postings(data):
+    """Decode the postings of one CIK back to (key id, days, accession) tuples."""
+    postings = []
+    pos = 0
+    while pos < len(data):
+        key_id, pos = _read_varint(data, pos)
+        count, pos = _read_varint(data, pos)
+        days = 0
+        for _ in range(count):
+            delta, pos = _read_varint(data, pos)
+            accession, pos = _read_varint(data, pos)
+            days += delta
+            postings.append((key_id, days, accession))
+    return postings
+
+
+def _write_index(index_dir, entries, keys, rows):
+    """Write the directory, postings and meta files from (cik, encoded postings, count) entries sorted by cik."""
+    os.makedirs(index_dir, exist_ok=True)
+    directory_path, postings_path, meta_path = _paths(index_dir)
+
+    directory = np.zeros(len(entries), dtype=DIRECTORY_DTYPE)
+    offset = 0
+    with open(postings_path + '.tmp', 'wb') as f:
+        for i, (cik, data, count) in enumerate(entries):
+            directory[i] = (cik, count, offset, len(data))
+            f.write(data)
+            offset += len(data)
+    directory.tofile(directory_path + '.tmp')
+
+    os.replace(postings_path + '.tmp', postings_path)
+    os.replace(directory_path + '.tmp', directory_path)
+    # Written last: sizes that do not match the files mean an interrupted write, and trigger a rebuild
+    meta = {'keys': keys, 'rows': rows, 'directory_bytes': directory.nbytes, 'postings_bytes': offset}
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=4)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def build_index(index_dir=INDEX_DIR, mentions_dir=MENTIONS_DIR):
+    """Build the index from scratch out of the key index of every mention file."""
+    files = mention_files(mentions_dir)
+    keys = list(files)
+    columns = {'cik': [], 'key_id': [], 'days': [], 'accession': []}
+    rows = {}
+    for key_id, key in enumerate(keys):
+        records = load_records(files[key])
+        rows[key] = load_state(files[key])['rows']
+        columns['cik'].append(records['cik'].astype(np.int64))
+        columns['key_id'].append(np.full(len(records), key_id, dtype=np.int64))
+        columns['days'].append(records['days'].astype(np.int64))
+        columns['accession'].append(records['accession'].astype(np.uint64))
+    columns = {name: np.concatenate(values) if values else np.zeros(0, dtype=np.int64)
+               for name, values in columns.items()}
+
+    order = np.lexsort((columns['accession'], columns['days'], columns['key_id'], columns['cik']))
+    cik = columns['cik'][order]
+    postings = list(zip(columns['key_id'][order].tolist(), columns['days'][order].tolist(),
+                        columns['accession'][order].tolist()))
+
+    entries = []
+    bounds = np.flatnonzero(np.diff(cik)) + 1
+    for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(cik)]])):
+        if end > start:
+            data, count = encode_postings(postings[start:end])
+            entries.append((int(cik[start]), data, count))
+
+    _write_index(index_dir, entries, keys, rows)
+    print(f"Built CIK index with {len(entries)} CIKs and {len(postings)} postings")
+
+
+def _is_current(index_dir):
+    """Load the index meta, or None if the index is missing or its last write was interrupted."""
+    directory_path, postings_path, meta_path = _paths(index_dir)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if (not os.path.exists(directory_path) or os.path.getsize(directory_path) != meta['directory_bytes']
+            or not os.path.exists(postings_path) or os.path.getsize(postings_path) != meta['postings_bytes']):
+        return None
+    return meta
+
+
+def update_index(new_rows, index_dir=INDEX_DIR, mentions_dir=MENTIONS_DIR):
+    """
+    Add the rows a run appended to the index. Only the postings of CIKs in new_rows are decoded and
+    re-encoded; every other CIK's postings are copied as bytes.
+
+    If the index is missing, was interrupted, or does not account for every mention row (for example
+    after a key failed part way through a run), it is rebuilt instead.
+
+    Parameters:
+    new_rows (dict): Mention key -> rows appended by construct_mentions in this run
+    """
+    files = mention_files(mentions_dir)
+    meta = _is_current(index_dir)
+    new_rows = {key: rows for key, rows in new_rows.items() if rows}
+    if meta is not None:
+        for key, path in files.items():
+            expected = meta['rows'].get(key, 0) + len(new_rows.get(key, []))
+            if load_state(path)['rows'] != expected:
+                meta = None
+                break
+    if meta is None:
+        build_index(index_dir, mentions_dir)
+        return
+    if not new_rows:
+        return
+
+    keys = meta['keys']
+    key_ids = {key: i for i, key in enumerate(keys)}
+    added = defaultdict(list)
+    for key, rows in new_rows.items():
+        if key not in key_ids:
+            key_ids[key] = len(keys)
+            keys.append(key)
+        for filing_date, cik, accession_number, _ in rows:
+            added[int(cik)].append((key_ids[key], pack_date(filing_date), pack_accession(accession_number)))
+        meta['rows'][key] = meta['rows'].get(key, 0) + len(rows)
+
+    directory_path, postings_path, _ = _paths(index_dir)
+    directory = np.fromfile(directory_path, dtype=DIRECTORY_DTYPE)
+    with open(postings_path, 'rb') as f:
+        blob = f.read()
+
+    entries = []
+    touched = sorted(added)
+    i = 0
+    for entry in directory:
+        cik = int(entry['cik'])
+        # CIKs seen for the first time are slotted in ahead of the next existing CIK
+        while i < len(touched) and touched[i] < cik:
+            entries.append((touched[i], *encode_postings(added[touched[i]])))
+            i += 1
+        data = blob[int(entry['offset']):int(entry['offset']) + int(entry['length'])]
+        if i < len(touched) and touched[i] == cik:
+            entries.append((cik, *encode_postings(decode_postings(data) + added[cik])))
+            i += 1
+        else:
+            entries.append((cik, data, int(entry['count'])))
+    for cik in touched[i:]:
+        entries.append((cik, *encode_postings(added[cik])))
+
+    _write_index(index_dir, entries, keys, meta['rows'])
+    print(f"Updated CIK index for {len(touched)} CIKs")
+
+
+class CikIndex:
+    """
+    Read-only view of the CIK index. The directory and postings are memory-mapped, so a lookup is a
+    binary search plus decoding one CIK's postings.
+    """
+    def __init__(self, index_dir=INDEX_DIR):
+        directory_path, postings_path, meta_path = _paths(index_dir)
+        with open(meta_path) as f:
+            self.keys = json.load(f)['keys']
+        self.directory = np.memmap(directory_path, dtype=DIRECTORY_DTYPE, mode='r') \
+            if os.path.getsize(directory_path) else np.zeros(0, dtype=DIRECTORY_DTYPE)
+        self.postings = np.memmap(postings_path, dtype=np.uint8, mode='r') \
+            if os.path.getsize(postings_path) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.directory)
+
+    def lookup(self, cik, key=None, start_date=None, end_date=None):
+        """
+        Mentions of a company across all mention keys.
+
+        Parameters:
+        cik (int or str): Company CIK
+        key (str, optional): Restrict to one mention key
+        start_date, end_date (str, optional): Inclusive filing date bounds in YYYY-MM-DD format
+
+        Returns:
+        list: (mention key, filing_date, accession_number) tuples sorted by key and date
+        """
+        cik = int(cik)
+        i = int(np.searchsorted(self.directory['cik'], cik))
+        if i == len(self.directory) or int(self.directory['cik'][i]) != cik:
+            return []
+        entry = self.directory[i]
+        data = self.postings[int(entry['offset']):int(entry['offset']) + int(entry['length'])].tobytes()
+
+        low = pack_date(start_date) if start_date else None
+        high = pack_date(end_date) if end_date else None
+        results = []
+        for key_id, days, accession in decode_postings(data):
+            if key is not None and self.keys[key_id] != key:
+                continue
+            if (low is not None and days < low) or (high is not None and days > high):
+                continue
+            results.append((self.keys[key_id], unpack_date(days), unpack_accession(accession)))
+        return results
+
+    def topics(self, cik):
+        """Count mentions per key for a company."""
+        counts = defaultdict(int)
+        for key, _, _ in self.lookup(cik):
+            counts[key] += 1
+        return dict(counts)
+
+
+if __name__ == "__main__":
+    # Usage: python code/cikindex.py build
+    #        python code/cikindex.py lookup CIK [KEY]
+    command = sys.argv[1]
+    if command == 'build':
+        build_index()
+    elif command == 'lookup':
+        index = CikIndex()
+        key = sys.argv[3] if len(sys.argv) > 3 else None
+        for mention_key, filing_date, accession_number in index.lookup(sys.argv[2], key=key):
+            print(f"{mention_key},{filing_date},{accession_number}")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
@@ -0,0 +1,150 @@
+import glob
+import os
+import sys
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from keyindex import pack_accession, unpack_accession
+from mentionstore import iter_rows, load_state
+
+DATASET_DIR = 'data/columnar/mentions'
+
+SCHEMA = pa.schema([
+    ('filing_date', pa.date32()),
+    ('cik', pa.int64()),
+    # Packed as filer * 10**8 + year * 10**6 + sequence, see keyindex.pack_accession
+    ('accession', pa.int64()),
+    ('filename', pa.string()),
+])
+
+# Small row groups keep date statistics selective for "key between dates" scans
+ROW_GROUP_SIZE = 16384
+
+# Nightly parts for a key are merged into one file once there are more than this many
+MAX_PARTS = 30
+
+
+def _partition_dir(key, root):
+    return os.path.join(root, f'key={key}')
+
+
+def to_table(rows):
+    """Convert mention CSV rows to a typed table sorted by filing date."""
+    rows = sorted(rows, key=lambda row: row[0])
+    return pa.table({
+        'filing_date': pa.array([date.fromisoformat(row[0]) for row in rows], type=pa.date32()),
+        'cik': pa.array([int(row[1]) for row in rows], type=pa.int64()),
+        'accession': pa.array([pack_accession(row[2]) for row in rows], type=pa.int64()),
+        'filename': pa.array([row[3] for row in rows], type=pa.string()),
+    }, schema=SCHEMA)
+
+
+def _write_part(partition, table):
+    os.makedirs(partition, exist_ok=True)
+    existing = glob.glob(os.path.join(partition, 'part-*.parquet'))
+    number = max([int(os.path.basename(path)[5:-8]) for path in existing], default=-1) + 1
+    path = os.path.join(partition, f'part-{number:05d}.parquet')
+    pq.write_table(table, path + '.tmp', row_group_size=ROW_GROUP_SIZE)
+    os.replace(path + '.tmp', path)
+    return len(existing) + 1
+
+
+def _exported_rows(partition):
+    """Rows held by the parts of a partition, read from the parquet footers rather than trusted from a counter."""
+    return sum(pq.ParquetFile(path).metadata.num_rows
+               for path in glob.glob(os.path.join(partition, 'part-*.parquet')))
+
+
+def compact_partition(partition):
+    """
+    Merge all parts of a key into a single file sorted by filing date. A crash before the superseded parts are
+    removed leaves more rows than the CSV holds, which the next sync_mentions detects and rebuilds.
+    """
+    paths = sorted(glob.glob(os.path.join(partition, 'part-*.parquet')))
+    table = pa.concat_tables([pq.read_table(path, schema=SCHEMA) for path in paths]).sort_by('filing_date')
+    tmp_path = os.path.join(partition, 'compacted.tmp')
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    target = os.path.join(partition, 'part-00000.parquet')
+    # Put the compacted file in place before dropping the parts it supersedes, so the rows are never missing
+    os.replace(tmp_path, target)
+    for path in paths:
+        if path != target:
+            os.remove(path)
+
+
+def export_mentions(key, csv_path, root=DATASET_DIR):
+    """(Re)build the partition of one mention key from its CSV."""
+    partition = _partition_dir(key, root)
+    for path in glob.glob(os.path.join(partition, 'part-*.parquet')):
+        os.remove(path)
+    rows = list(iter_rows(csv_path)) if os.path.exists(csv_path) else []
+    _write_part(partition, to_table(rows))
+    return len(rows)
+
+
+def sync_mentions(key, csv_path, new_rows, root=DATASET_DIR):
+    """
+    Bring the partition of a mention key up to date after construct_mentions appended new_rows to csv_path.
+
+    New rows are written as one more part. If the parts do not hold exactly the CSV rows before new_rows (first
+    run, a lost sync, or a crash that left superseded parts behind a compaction) it is rebuilt from the CSV
+    instead.
+    """
+    partition = _partition_dir(key, root)
+    total = load_state(csv_path)['rows']
+    if not os.path.isdir(partition) or _exported_rows(partition) + len(new_rows) != total:
+        print(f"Rebuilding columnar partition for {key}")
+        export_mentions(key, csv_path, root)
+        return
+
+    if new_rows and _write_part(partition, to_table(new_rows)) > MAX_PARTS:
+        compact_partition(partition)
+
+
+def read_mentions(key=None, start_date=None, end_date=None, root=DATASET_DIR):
+    """
+    Read mention rows, scanning only the partitions and row groups that can match.
+
+    Parameters:
+    key (str or list, optional): Mention key(s) to read
+    start_date, end_date (datetime.date, optional): Inclusive filing date bounds
+
+    Returns:
+    pyarrow.Table with key, filing_date, cik, accession and filename columns
+    """
+    dataset = ds.dataset(root, format='parquet', partitioning='hive', schema=SCHEMA.append(pa.field('key', pa.string())))
+    condition = None
+    clauses = []
+    if key is not None:
+        clauses.append(ds.field('key').isin(key if isinstance(key, list) else [key]))
+    if start_date is not None:
+        clauses.append(ds.field('filing_date') >= pa.scalar(start_date, type=pa.date32()))
+    if end_date is not None:
+        clauses.append(ds.field('filing_date') <= pa.scalar(end_date, type=pa.date32()))
+    for clause in clauses:
+        condition = clause if condition is None else condition & clause
+    return dataset.to_table(filter=condition)
+
+
+def accession_strings(table):
+    """Unpack the accession column of a table back to the 0000000000-00-000000 format."""
+    return [unpack_accession(value) for value in table.column('accession').to_pylist()]
+
+
+if __name__ == "__main__":
+    # Usage: python code/columnar.py export        rebuild every partition from data/mentions
+    #        python code/columnar.py query KEY [START END]
+    command = sys.argv[1]
+    if command == 'export':
+        for csv_path in sorted(glob.glob('data/mentions/*/*/*.csv.gz')):
+            key = os.path.basename(csv_path)[:-len('.csv.gz')]
+            print(f"{key}: {export_mentions(key, csv_path)} rows")
+    elif command == 'query':
+        bounds = [date.fromisoformat(value) for value in sys.argv[3:5]]
+        table = read_mentions(sys.argv[2], *bounds)
+        print(f"{table.num_rows} rows")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
@@ -0,0 +1,153 @@
+import ast
+import csv
+import gzip
+import os
+import shutil
+import sys
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from columnar import DATASET_DIR, ROW_GROUP_SIZE, read_mentions
+from keyindex import pack_date
+
+METADATA_FILENAME = 'data/filer_metadata/listed_filer_metadata.csv.gz'
+NAMES_FILENAME = 'data/filer_metadata/listed_filer_names.csv.gz'
+ENRICHED_DIR = 'data/columnar/enriched_mentions'
+
+ENRICHED_FIELDS = [
+    ('name', pa.string()),
+    ('tickers', pa.string()),
+    ('sic', pa.int32()),
+    ('sic_description', pa.string()),
+    ('listed', pa.bool_()),
+]
+
+
+def _parse_list(value):
+    """Parse list columns written as Python reprs, e.g. "['AIR']"."""
+    try:
+        items = ast.literal_eval(value) if value else []
+    except (ValueError, SyntaxError):
+        return ''
+    return ','.join(item for item in items if item)
+
+
+class FilerTable:
+    """
+    Filer metadata held as sorted arrays keyed by CIK, plus the name history keyed by cik << 32 | start day.
+
+    Lookups are vectorised binary searches, so joining a million rows is a handful of searchsorted calls.
+    """
+    def __init__(self, metadata_filename=METADATA_FILENAME, names_filename=NAMES_FILENAME):
+        with gzip.open(metadata_filename, 'rt', newline='') as f:
+            rows = sorted(csv.DictReader(f), key=lambda row: int(row['cik']))
+        self.ciks = np.array([int(row['cik']) for row in rows], dtype=np.int64)
+        self.tickers = np.array([_parse_list(row['tickers']) for row in rows], dtype=object)
+        self.sic = np.array([int(row['sic']) if row['sic'].isdigit() else -1 for row in rows], dtype=np.int32)
+        self.sic_description = np.array([row['sicDescription'] or None for row in rows], dtype=object)
+
+        with gzip.open(names_filename, 'rt', newline='') as f:
+            names = [(int(row['cik']), pack_date(row['start_date']), row['name']) for row in csv.DictReader(f)]
+        names.sort()
+        self.name_keys = np.array([(cik << 32) | days for cik, days, _ in names], dtype=np.int64)
+        self.name_ciks = self.name_keys >> 32
+        self.names = np.array([name for _, _, name in names], dtype=object)
+
+    def __len__(self):
+        return len(self.ciks)
+
+    def names_asof(self, ciks, days):
+        """
+        Name of each CIK as of each day: the latest name that started on or before the day. Days before a
+        company's first recorded name get that first name. CIKs without any history get None.
+        """
+        ciks = np.asarray(ciks, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        position = np.searchsorted(self.name_keys, (ciks << 32) | days, side='right') - 1
+        # Step forward to the first name when the day predates the history (or the search landed on the previous CIK)
+        before = (position < 0) | (self.name_ciks[np.clip(position, 0, None)] != ciks)
+        position = np.where(before, position + 1, position)
+        clipped = np.clip(position, 0, len(self.names) - 1)
+        found = (position < len(self.names)) & (self.name_ciks[clipped] == ciks)
+        return np.where(found, self.names[clipped], None)
+
+    def locate(self, ciks):
+        """Row of each CIK in the metadata arrays, and whether it is present at all."""
+        ciks = np.asarray(ciks, dtype=np.int64)
+        position = np.searchsorted(self.ciks, ciks)
+        clipped = np.clip(position, 0, len(self.ciks) - 1)
+        return clipped, self.ciks[clipped] == ciks
+
+
+def enrich(table, filers):
+    """
+    Join mention rows to filer metadata.
+
+    Parameters:
+    table (pyarrow.Table): Mention rows with at least filing_date (date32) and cik columns
+    filers (FilerTable): Loaded filer metadata
+
+    Returns:
+    pyarrow.Table: table plus name (as of filing_date), tickers, sic, sic_description and listed columns
+    """
+    ciks = table.column('cik').to_numpy()
+    days = table.column('filing_date').cast(pa.int32()).to_numpy()
+    position, listed = filers.locate(ciks)
+
+    columns = {
+        'name': filers.names_asof(ciks, days),
+        'tickers': np.where(listed, filers.tickers[position], None),
+        'sic': pa.array(filers.sic[position], mask=~listed | (filers.sic[position] < 0)),
+        'sic_description': np.where(listed, filers.sic_description[position], None),
+        'listed': listed,
+    }
+    for field, field_type in ENRICHED_FIELDS:
+        table = table.append_column(pa.field(field, field_type), pa.array(columns[field], type=field_type))
+    return table
+
+
+def build_enriched(output_dir=ENRICHED_DIR, mentions_dir=DATASET_DIR, filers=None):
+    """
+    Rebuild the enriched dataset from the columnar mentions in one pass. Everything is rejoined on every
+    run, since names and tickers change as the filer metadata is refreshed.
+
+    Returns:
+    int: Number of rows written
+    """
+    if filers is None:
+        filers = FilerTable()
+    table = read_mentions(root=mentions_dir).sort_by([('key', 'ascending'), ('filing_date', 'ascending')])
+    table = enrich(table, filers)
+
+    # Written beside the current dataset and swapped in, so readers never see a partial rebuild
+    tmp_dir = output_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    ds.write_dataset(table, tmp_dir, format='parquet',
+                     partitioning=ds.partitioning(pa.schema([('key', pa.string())]), flavor='hive'),
+                     max_rows_per_group=ROW_GROUP_SIZE)
+    old_dir = output_dir + '.old'
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return table.num_rows
+
+
+def read_enriched(key=None, root=ENRICHED_DIR):
+    """Read enriched mention rows, optionally for one key or a list of keys."""
+    dataset = ds.dataset(root, format='parquet', partitioning='hive')
+    condition = None
+    if key is not None:
+        condition = ds.field('key').isin(key if isinstance(key, list) else [key])
+    return dataset.to_table(filter=condition)
+
+
+if __name__ == "__main__":
+    # Usage: python code/enrichment.py build
+    command = sys.argv[1]
+    if command == 'build':
+        print(f"Enriched {build_enriched()} mention rows")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
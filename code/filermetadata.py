@@ -0,0 +1,184 @@
+import asyncio
+import csv
+import glob
+import gzip
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+from manifest import replace_if_changed
+from datamule.sec.infrastructure.submissions_metadata import (download_sec_file, extract_metadata,
+                                                              process_former_names, process_submissions_metadata,
+                                                              write_metadata_to_csv, write_names_to_csv)
+
+SEC_URL = "https://www.sec.gov/Archives/edgar/daily-index/bulkdata/submissions.zip"
+DETECTED_TIME_PATTERN = 'data/datasets/detected_time_*.csv.gz'
+
+OUTPUTS = {
+    ('listed', 'metadata'): 'listed_filer_metadata.csv.gz',
+    ('unlisted', 'metadata'): 'unlisted_filer_metadata.csv.gz',
+    ('listed', 'names'): 'listed_filer_names.csv.gz',
+    ('unlisted', 'names'): 'unlisted_filer_names.csv.gz',
+}
+
+
+def _entries(zip_ref):
+    """Company JSON entries of the submissions zip, filtered the same way as process_submissions_metadata."""
+    return [info for info in zip_ref.infolist()
+            if not info.is_dir() and 'submission' not in info.filename and 'placeholder.txt' not in info.filename]
+
+
+def _entry_cik(info):
+    # Entries are named CIK0000320193.json
+    return int(os.path.basename(info.filename)[3:-len('.json')])
+
+
+def _modified(info):
+    return '%04d-%02d-%02dT%02d:%02d:%02d' % info.date_time
+
+
+def detected_ciks(since, pattern=DETECTED_TIME_PATTERN):
+    """
+    Filer CIKs of accessions detected after since (local YYYY-MM-DD HH:MM:SS), from the detected_time datasets.
+
+    The first ten digits of an accession number identify whoever submitted it, which is the company itself
+    for self-filed submissions but a filing agent otherwise, so this only adds hints to the zip timestamps.
+    """
+    # detectedTime is UTC (...Z), while the watermark is local time
+    since = datetime.strptime(since, "%Y-%m-%d %H:%M:%S").astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    ciks = set()
+    for path in glob.glob(pattern):
+        with gzip.open(path, 'rt', newline='') as f:
+            for row in csv.DictReader(f):
+                if row['detectedTime'] >= since:
+                    # Accession numbers may be stored without dashes or leading zeros
+                    ciks.add(int(row['accessionNumber'].replace('-', '')) // 10**8)
+    return ciks
+
+
+def parse_entry(zip_ref, info, max_bytes=2000):
+    """
+    Parse one company entry the way process_submissions_metadata does: the head of the file up to "filings",
+    and the full file only when there are no former names to date the company from.
+
+    Returns:
+        (metadata, name records, listed)
+    """
+    with zip_ref.open(info) as f:
+        partial_content = f.read(max_bytes).decode('utf-8', errors='replace')
+    filings_index = partial_content.find('"filings":')
+    if filings_index != -1:
+        partial_content = partial_content[:filings_index]
+    data = json.loads(partial_content.rstrip().rstrip(',') + '}')
+
+    if not data.get('formerNames'):
+        with zip_ref.open(info) as f:
+            try:
+                data = json.loads(f.read().decode('utf-8', errors='replace'))
+            except json.JSONDecodeError:
+                print(f"Warning: Could not parse full content of {info.filename}, using partial data")
+
+    metadata = extract_metadata(data)
+    names, earliest_company_date = process_former_names(data, metadata.get('cik', ''), metadata.get('name', ''))
+    metadata['start_date'] = earliest_company_date if earliest_company_date else ''
+    tickers = metadata.get('tickers', [])
+    listed = bool(tickers) and isinstance(tickers, list)
+    return metadata, names, listed
+
+
+def _read_rows(path):
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def merge_outputs(output_dir, parsed):
+    """
+    Replace the rows of every parsed CIK in the four output files, leaving all other filers untouched.
+    A CIK is removed from both the listed and unlisted files, since it may have moved between them.
+
+    Args:
+        parsed: Dictionary mapping cik -> (metadata, name records, listed)
+    """
+    for (status, kind), filename in OUTPUTS.items():
+        path = os.path.join(output_dir, filename)
+        rows = [row for row in _read_rows(path) if int(row['cik']) not in parsed]
+        for metadata, names, listed in parsed.values():
+            if listed == (status == 'listed'):
+                rows.extend([metadata] if kind == 'metadata' else names)
+        if not rows:
+            continue
+        # Stable sort keeps each company's name history in its original order
+        rows.sort(key=lambda row: int(row['cik']))
+
+        tmp_path = path[:-len('.csv.gz')] + '.tmp.csv.gz'
+        if kind == 'metadata':
+            write_metadata_to_csv(rows, tmp_path)
+        else:
+            write_names_to_csv(rows, tmp_path)
+        # Files whose rows did not change keep their old bytes, so they are not recommitted
+        replace_if_changed(tmp_path, path)
+
+
+def refresh_filer_metadata(output_dir, watermark=None, since=None, sec_url=SEC_URL, local_zip_path=None):
+    """
+    Refresh the filer metadata outputs, re-parsing only companies whose zip entry changed since the last run.
+
+    Without a watermark or existing outputs, the full process_submissions_metadata extraction runs instead.
+
+    Args:
+        output_dir: Directory holding the filer metadata CSVs
+        watermark: Latest zip entry timestamp seen by the previous run
+        since: Time of the previous run, used to add CIKs from the detected_time datasets
+        sec_url: URL of the SEC submissions zip
+        local_zip_path: Use a local copy of the zip instead of downloading it
+
+    Returns:
+        Dictionary with 'mode', 'entries', 'parsed' and the new 'watermark'
+    """
+    zip_path = local_zip_path
+    if zip_path is None:
+        temp_file = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
+        temp_file.close()
+        zip_path = temp_file.name
+
+    try:
+        if local_zip_path is None:
+            asyncio.run(download_sec_file(sec_url, zip_path))
+
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            entries = _entries(zip_ref)
+        new_watermark = max((_modified(info) for info in entries), default=watermark)
+
+        have_outputs = os.path.exists(os.path.join(output_dir, OUTPUTS[('listed', 'metadata')]))
+        if watermark is None or not have_outputs:
+            stats = process_submissions_metadata(output_dir=output_dir, local_zip_path=zip_path)
+            return {'mode': 'full', 'entries': len(entries), 'parsed': stats['total_processed'],
+                    'watermark': new_watermark}
+
+        hinted = detected_ciks(since) if since else set()
+        changed = [info for info in entries if _modified(info) > watermark or _entry_cik(info) in hinted]
+        print(f"{len(changed)} of {len(entries)} filers changed since {watermark}")
+
+        parsed = {}
+        errors = 0
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for info in changed:
+                try:
+                    metadata, names, listed = parse_entry(zip_ref, info)
+                    parsed[int(metadata['cik'])] = (metadata, names, listed)
+                except Exception as e:
+                    errors += 1
+                    print(f"Error processing {info.filename}: {str(e)}")
+
+        if parsed:
+            merge_outputs(output_dir, parsed)
+        # Entries that failed to parse are retried next run by keeping the old watermark
+        return {'mode': 'incremental', 'entries': len(entries), 'parsed': len(parsed),
+                'watermark': watermark if errors else new_watermark}
+    finally:
+        if local_zip_path is None and os.path.exists(zip_path):
+            os.unlink(zip_path)
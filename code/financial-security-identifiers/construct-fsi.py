@@ -1,16 +1,30 @@
 from datamule import Portfolio
 import gzip
 import csv
+import io
+import json
 import time
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
-from utils import validate_identifiers, deduplicate_and_merge
+from utils import validate_identifiers, validate_check_digits, deduplicate_and_merge_columns
 
 # have to day by day. there is one week in 2024 with 15gb of data more than gh runners 14gb of storage.
 # Create datasets directory if it doesn't exist
 import os
 os.makedirs('data/datasets', exist_ok=True)
 
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from instrumentation import count, span, write_report
+from manifest import deterministic_gzip, replace_if_changed, update_manifest
+
+OUTPUT_FILENAME = 'data/datasets/financial_security_identifiers_crosswalk.csv.gz'
+
+# Streaming state, kept between runs by the workflow cache
+STATE_DIR = '.cache/fsi'
+STATE_FILENAME = os.path.join(STATE_DIR, 'state.json')
+IDENTIFIERS_FILENAME = os.path.join(STATE_DIR, 'identifiers.csv.gz')
+
 def extract_fidi(tables):
     fidi = []
     for table in tables:
@@ -63,64 +77,177 @@ def download_portfolio_with_retry(start_date, end_date, max_retries=3, wait_seco
                 print(f"All {max_retries} attempts failed for {start_date}")
                 raise e
 
-all_rows = []
-total_fail_count = 0
+def load_state():
+    """Load the streaming state: last finished day and the distinct identifier tuples seen so far."""
+    state = {'last_day': None, 'rows': 0, 'failures': 0, 'rejections': {}}
+    if os.path.exists(STATE_FILENAME):
+        with open(STATE_FILENAME) as f:
+            state = json.load(f)
 
-day_ranges = get_day_ranges(2024)
-print(f"Processing {len(day_ranges)} days from 2024 to present")
+    seen = set()
+    if os.path.exists(IDENTIFIERS_FILENAME):
+        with gzip.open(IDENTIFIERS_FILENAME, 'rt', newline='') as csvfile:
+            for row in csv.reader(csvfile):
+                seen.add(tuple(row))
+    return state, seen
 
-for start_date, end_date in day_ranges:
-    print(f"Processing day: {start_date} to {end_date}")
-    
-    portfolio = download_portfolio_with_retry(start_date, end_date)
 
-    month_rows = []
-    fail_count = 0
-    
-    for sub in portfolio:
-        accession = sub.metadata.content['accession-number']
+def save_state(state):
+    tmp_filename = STATE_FILENAME + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_filename, STATE_FILENAME)
+
+
+def append_identifiers(tuples):
+    """Append identifier tuples to the on-disk log as a new gzip member, written in one piece."""
+    if not tuples:
+        return
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as gz:
+        text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        csv.writer(text).writerows(tuples)
+        text.flush()
+        text.detach()
+    size = os.path.getsize(IDENTIFIERS_FILENAME) if os.path.exists(IDENTIFIERS_FILENAME) else 0
+    with open(IDENTIFIERS_FILENAME, 'ab') as raw:
         try:
-            for doc in sub:
-                if doc.extension == '.xml':
-                    doc_rows = extract_fidi(doc.tables)
-                    # Add accession number to each row
-                    doc_rows = [dict(row, accession=accession) for row in doc_rows]
-                    month_rows.extend(doc_rows)
-        except Exception as e:
-            print(f"Error processing {accession}: {e}")
-            fail_count += 1
-    
-    print(f"Day {start_date}: {len(month_rows)} rows, {fail_count} failures")
-    all_rows.extend(month_rows)
-    total_fail_count += fail_count
+            raw.write(buffer.getvalue())
+            raw.flush()
+            os.fsync(raw.fileno())
+        except Exception:
+            # Never leave a partial member behind
+            raw.truncate(size)
+            raise
+
+
+def process_day(start_date, end_date, seen):
+    """
+    Download one day of N-PX filings and reduce its validated rows to identifier tuples not seen before.
+
+    Returns:
+        (new tuples in first-seen order, raw row count, failure count, rejection counts)
+    """
+    with span('download', day=start_date):
+        portfolio = download_portfolio_with_retry(start_date, end_date)
+
+    day_rows = []
+    fail_count = 0
     
+    with span('extract', day=start_date):
+        for sub in portfolio:
+            accession = sub.metadata.content['accession-number']
+            try:
+                for doc in sub:
+                    if doc.extension == '.xml':
+                        doc_rows = extract_fidi(doc.tables)
+                        # Add accession number to each row
+                        doc_rows = [dict(row, accession=accession) for row in doc_rows]
+                        day_rows.extend(doc_rows)
+            except Exception as e:
+                print(f"Error processing {accession}: {e}")
+                fail_count += 1
+
     # Clean up portfolio for next iteration
     portfolio.delete()
 
-print("Validating identifiers...")
-validated_rows = validate_identifiers(all_rows)
-print(f"Valid rows: {len(validated_rows)} (filtered from {len(all_rows)})")
+    with span('validate', day=start_date, rows=len(day_rows)):
+        validated_rows = validate_identifiers(day_rows)
+        validated_rows, rejections = validate_check_digits(validated_rows)
 
-print("Deduplicating and merging...")
-final_rows = deduplicate_and_merge(validated_rows)
-print(f"Final unique securities: {len(final_rows)}")
+    # Repeats of an identical tuple cannot change the merged result, so only the first occurrence is kept
+    new_tuples = []
+    for row in validated_rows:
+        identifiers = (row.get('cusip', ''), row.get('isin', ''), row.get('figi', ''))
+        if identifiers not in seen:
+            seen.add(identifiers)
+            new_tuples.append(identifiers)
 
-# Write all data to compressed CSV
-output_filename = f'data/datasets/financial_security_identifiers_crosswalk.csv.gz'
+    return new_tuples, len(day_rows), fail_count, rejections
 
-with gzip.open(output_filename, 'wt', newline='') as csvfile:
-    writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
-    writer.writerow(['cusip', 'isin', 'figi'])
-    
-    # Write rows, handling missing keys
-    for row in final_rows:
-        csv_row = [
-            row.get('cusip', ''),
-            row.get('isin', ''),
-            row.get('figi', '')
-        ]
-        writer.writerow(csv_row)
-
-print(f"Financial security identifiers data written to: {output_filename}")
-print(f"Total rows: {len(all_rows)}")
-print(f"Total failures: {total_fail_count}")
\ No newline at end of file
+
+def build_crosswalk(output_filename=OUTPUT_FILENAME):
+    """
+    Stream N-PX filings day by day into a log of distinct identifier tuples, then merge the log into the crosswalk.
+
+    Each day's rows are validated and reduced as soon as the day is downloaded, so memory grows with the number of
+    distinct identifier combinations rather than with history. Finished days are checkpointed, so an interrupted or
+    later run resumes after the last finished day.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    state, seen = load_state()
+
+    today = date.today().strftime('%Y-%m-%d')
+    day_ranges = [day for day in get_day_ranges(2024) if state['last_day'] is None or day[0] > state['last_day']]
+    if state['last_day'] is not None:
+        print(f"Resuming after {state['last_day']} with {len(seen)} identifier tuples")
+    print(f"Processing {len(day_ranges)} days")
+
+    for start_date, end_date in day_ranges:
+        print(f"Processing day: {start_date} to {end_date}")
+        new_tuples, row_count, fail_count, rejections = process_day(start_date, end_date, seen)
+        with span('append', day=start_date, rows=len(new_tuples)):
+            append_identifiers(new_tuples)
+        count('npx_rows', row_count)
+        count('new_tuples', len(new_tuples))
+        count('failures', fail_count)
+
+        # Today can still gain filings, so it is processed again by the next run and only finished days are
+        # added to the totals
+        if start_date < today:
+            state['rows'] += row_count
+            state['failures'] += fail_count
+            for rule, rule_count in rejections.items():
+                state['rejections'][rule] = state['rejections'].get(rule, 0) + rule_count
+            state['last_day'] = start_date
+            save_state(state)
+
+        print(f"Day {start_date}: {row_count} rows, {len(new_tuples)} new identifier tuples, {fail_count} failures")
+
+    print("Deduplicating and merging...")
+    columns = {'cusip': [], 'isin': [], 'figi': []}
+    with span('load'):
+        if os.path.exists(IDENTIFIERS_FILENAME):
+            with gzip.open(IDENTIFIERS_FILENAME, 'rt', newline='') as csvfile:
+                for cusip, isin, figi in csv.reader(csvfile):
+                    columns['cusip'].append(cusip)
+                    columns['isin'].append(isin)
+                    columns['figi'].append(figi)
+    with span('dedup', rows=len(columns['cusip'])):
+        merged = deduplicate_and_merge_columns(columns)
+    print(f"Final unique securities: {len(merged['cusip'])}")
+
+    # Write all data to compressed CSV, keeping the old file when nothing changed
+    tmp_filename = output_filename + '.tmp'
+    with span('write', rows=len(merged['cusip'])):
+        with deterministic_gzip(tmp_filename) as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+            writer.writerow(['cusip', 'isin', 'figi'])
+
+            # Write rows, handling missing keys
+            for cusip, isin, figi in zip(merged['cusip'], merged['isin'], merged['figi']):
+                writer.writerow([cusip or '', isin or '', figi or ''])
+        changed = replace_if_changed(tmp_filename, output_filename)
+
+    if changed:
+        print(f"Financial security identifiers data written to: {output_filename}")
+    else:
+        print(f"Financial security identifiers unchanged: {output_filename}")
+    try:
+        with span('manifest'):
+            changes = update_manifest()
+        count('changed_outputs', len(changes))
+        print(f"Manifest: {len(changes)} outputs changed")
+    except Exception as e:
+        print(f"Manifest: {e}")
+    print(f"Total rows: {state['rows']}")
+    print(f"Total failures: {state['failures']}")
+    for rule, rule_count in state['rejections'].items():
+        print(f"Rejected by {rule}: {rule_count}")
+
+    write_report('construct-fsi', extra={'days': len(day_ranges), 'securities': len(merged['cusip']),
+                                         'rejections': state['rejections']})
+
+
+if __name__ == "__main__":
+    build_crosswalk()
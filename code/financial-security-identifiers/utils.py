@@ -1,17 +1,30 @@
+import os
 import re
+import sys
+from array import array
 from collections import defaultdict
 
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from checkdigits import validate_columns
+
+IDENTIFIERS = ['cusip', 'isin', 'figi']
+
 class UnionFind:
-    """Union-Find data structure with path compression and union by rank."""
+    """Union-Find data structure over flat int arrays, with path halving and union by rank."""
     def __init__(self, n):
-        self.parent = list(range(n))
-        self.rank = [0] * n
+        self.parent = array('l', range(n))
+        # Union by rank keeps ranks below log2(n), so a byte is enough
+        self.rank = array('B', bytes(n))
     
     def find(self, x):
-        """Find with path compression."""
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])
-        return self.parent[x]
+        """Iterative find with path halving, so long chains cannot hit the recursion limit."""
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
     
     def union(self, x, y):
         """Union by rank."""
@@ -75,10 +88,185 @@ def validate_identifiers(rows):
     return validated_rows
 
 
+def validate_check_digits(rows):
+    """
+    Drop identifiers with a wrong check digit (CUSIP mod 10, ISIN Luhn, FIGI checksum), validating each column in one batch.
+    
+    Args:
+        rows: List of dictionaries with shape-validated financial identifiers
+    
+    Returns:
+        (rows that still have at least 2 valid identifiers, rejection counts per rule)
+    """
+    columns = {identifier: [row.get(identifier) for row in rows] for identifier in IDENTIFIERS}
+    masks, rejections = validate_columns(columns)
+    
+    checked_rows = []
+    for i, row in enumerate(rows):
+        checked_row = {key: value for key, value in row.items() if key not in IDENTIFIERS or masks[key][i]}
+        if sum(1 for key in IDENTIFIERS if key in checked_row) >= 2:
+            checked_rows.append(checked_row)
+    
+    return checked_rows, rejections
+
+
+# Identifier characters as base 37 digits: 0 for padding, then 0-9 and A-Z. Since 37**12 < 2**63,
+# identifiers of up to 12 characters pack exactly into one int64.
+PACK_VALUES = np.full(128, -1, dtype=np.int64)
+PACK_VALUES[0] = 0
+PACK_VALUES[ord('0'):ord('9') + 1] = np.arange(1, 11)
+PACK_VALUES[ord('A'):ord('Z') + 1] = np.arange(11, 37)
+PACK_WIDTH = 12
+
+
+def pack_identifiers(values):
+    """
+    Pack identifier strings into exact int64 keys, 0 where the value is missing.
+    
+    Returns:
+        NumPy int64 array, or None if any value is too long or has characters outside 0-9 and A-Z
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'U':
+        # Unicode arrays are UCS-4, padded with NUL, so they can be read as characters without copying
+        width = values.dtype.itemsize // 4
+        if width > PACK_WIDTH:
+            return None
+        chars = values.view(np.uint32).reshape(len(values), width)
+    else:
+        values = [value or '' for value in values]
+        if any(len(value) > PACK_WIDTH for value in values):
+            return None
+        try:
+            joined = ''.join(value.ljust(PACK_WIDTH, '\0') for value in values).encode('ascii')
+        except UnicodeEncodeError:
+            return None
+        chars = np.frombuffer(joined, dtype=np.uint8).reshape(len(values), PACK_WIDTH)
+    
+    if chars.size and chars.max() >= len(PACK_VALUES):
+        return None
+    digits = PACK_VALUES[chars]
+    if (digits < 0).any():
+        return None
+    
+    packed = np.zeros(len(chars), dtype=np.int64)
+    for column in range(chars.shape[1]):
+        packed = packed * 37 + digits[:, column]
+    return packed
+
+
+def intern_identifiers(values):
+    """
+    Map identifier strings to integer codes.
+    
+    Returns:
+        NumPy int64 array of codes, -1 where the value is missing
+    """
+    packed = pack_identifiers(values)
+    if packed is not None:
+        _, codes = np.unique(packed, return_inverse=True)
+        codes = codes.astype(np.int64).ravel()
+        codes[packed == 0] = -1
+        return codes
+    
+    # Values that cannot be packed are interned through a dictionary instead
+    if isinstance(values, np.ndarray):
+        values = values.tolist()
+    table = {}
+    return np.fromiter((table.setdefault(value, len(table)) if value else -1 for value in values),
+                       dtype=np.int64, count=len(values))
+
+
+def component_labels(code_columns, n):
+    """
+    Label rows connected through any shared identifier code with the smallest row index in their component.
+    
+    A vectorised union-find: rows sharing a code are linked to the first row of that code, then every round
+    hooks the larger root of each link onto the smaller one and pointer-jumps parents (parent = parent[parent])
+    until every row points at its root. Roots that survive a round have no smaller neighbouring root, so the
+    number of roots keeps shrinking and long chains take a logarithmic number of rounds, not one per link.
+    """
+    parent = np.arange(n, dtype=np.int64)
+    
+    # Links from the first row of each run of equal codes to every other row in the run
+    sources, targets = [], []
+    for codes in code_columns:
+        rows = np.flatnonzero(codes >= 0)
+        if len(rows) == 0:
+            continue
+        order = rows[np.argsort(codes[rows], kind='stable')]
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        first = np.repeat(order[starts], np.diff(np.r_[starts, len(order)]))
+        linked = first != order
+        sources.append(first[linked])
+        targets.append(order[linked])
+    if not sources:
+        return parent
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    
+    while True:
+        roots_a, roots_b = parent[sources], parent[targets]
+        pending = roots_a != roots_b
+        if not pending.any():
+            return parent
+        # Only links between different trees matter from here on
+        sources, targets = sources[pending], targets[pending]
+        roots_a, roots_b = roots_a[pending], roots_b[pending]
+        np.minimum.at(parent, np.maximum(roots_a, roots_b), np.minimum(roots_a, roots_b))
+        
+        # Parents always point at a smaller row, so jumping converges on the root
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+
+
+def deduplicate_and_merge_columns(columns):
+    """
+    Columnar deduplication: rows sharing any identifier are merged into one security.
+    
+    Args:
+        columns: Dictionary mapping 'cusip'/'isin'/'figi' -> equal-length sequences of strings (None or '' for missing)
+    
+    Returns:
+        Dictionary mapping 'cusip'/'isin'/'figi' -> lists of merged values (None for missing), one entry per
+        security with at least 2 identifiers. Securities are ordered by their first row, and each identifier
+        takes the value from the first row of the security that has one, as in deduplicate_and_merge.
+    """
+    n = len(columns[IDENTIFIERS[0]])
+    if n == 0:
+        return {identifier: [] for identifier in IDENTIFIERS}
+    
+    code_columns = [intern_identifiers(columns[identifier]) for identifier in IDENTIFIERS]
+    labels = component_labels(code_columns, n)
+    # Each component is labelled with its first row, so roots are the rows labelled with themselves
+    roots = np.flatnonzero(labels == np.arange(n))
+    
+    # For each identifier, the first row of every component that has a value. Rows are assigned in reverse,
+    # so for repeated labels the last write, the smallest row, wins.
+    source_rows = {}
+    for identifier, codes in zip(IDENTIFIERS, code_columns):
+        rows = np.flatnonzero(codes >= 0)[::-1]
+        first_row = np.full(n, -1, dtype=np.int64)
+        first_row[labels[rows]] = rows
+        source_rows[identifier] = first_row[roots]
+    
+    # Only include if we have at least 2 identifiers
+    keep = sum((source_rows[identifier] >= 0).astype(np.int64) for identifier in IDENTIFIERS) >= 2
+    
+    merged = {}
+    for identifier in IDENTIFIERS:
+        values = columns[identifier]
+        merged[identifier] = [values[i] if i >= 0 else None for i in source_rows[identifier][keep].tolist()]
+    return merged
+
+
 def deduplicate_and_merge(rows):
     """
-    Optimized deduplication using Union-Find and hash indices.
-    Time complexity: O(n × α(n)) ≈ O(n)
+    Deduplicate rows that share any identifier, merging them into one dictionary per security.
+    Works on interned integer codes with vectorized connected components, see deduplicate_and_merge_columns.
     
     Args:
         rows: List of validated dictionaries with financial identifiers
@@ -89,51 +277,11 @@ def deduplicate_and_merge(rows):
     if not rows:
         return []
     
-    n = len(rows)
-    uf = UnionFind(n)
-    
-    # Build reverse indices for O(1) lookup
-    indices = {
-        'cusip': defaultdict(list),
-        'isin': defaultdict(list),
-        'figi': defaultdict(list)
-    }
+    columns = {identifier: [row.get(identifier) for row in rows] for identifier in IDENTIFIERS}
+    merged = deduplicate_and_merge_columns(columns)
     
-    # Single pass to build indices
-    for i, row in enumerate(rows):
-        for identifier_type in ['cusip', 'isin', 'figi']:
-            if identifier_type in row and row[identifier_type]:
-                value = row[identifier_type]
-                indices[identifier_type][value].append(i)
-    
-    # Connect components using Union-Find
-    for identifier_type in ['cusip', 'isin', 'figi']:
-        for value, row_indices in indices[identifier_type].items():
-            if len(row_indices) > 1:
-                # Union all rows with this identifier value
-                first = row_indices[0]
-                for idx in row_indices[1:]:
-                    uf.union(first, idx)
-    
-    # Get connected components
-    groups = uf.get_groups()
-    
-    # Merge rows within each group
     final_rows = []
-    for root, group_indices in groups.items():
-        # Merge all identifiers from rows in this group
-        merged = {}
-        
-        for idx in group_indices:
-            row = rows[idx]
-            for identifier in ['cusip', 'isin', 'figi']:
-                if identifier in row and row[identifier]:
-                    # Keep the first non-null value we find for each identifier
-                    if identifier not in merged:
-                        merged[identifier] = row[identifier]
-        
-        # Only include if we have at least 2 identifiers
-        if sum(1 for k in ['cusip', 'isin', 'figi'] if k in merged) >= 2:
-            final_rows.append(merged)
+    for values in zip(*(merged[identifier] for identifier in IDENTIFIERS)):
+        final_rows.append({identifier: value for identifier, value in zip(IDENTIFIERS, values) if value})
     
-    return final_rows
\ No newline at end of file
+    return final_rows
@@ -1,102 +1,141 @@
 import json
 import os
+import time
 from datetime import datetime
-
-from datamule.sec.infrastructure.submissions_metadata import process_submissions_metadata
+from functools import partial
+
+from cikindex import update_index
+from columnar import sync_mentions
+from enrichment import build_enriched
+from filermetadata import refresh_filer_metadata
+from instrumentation import count, span, write_report
+from manifest import update_manifest
 from mentions import construct_mentions
-
-def save_progress(key, value):
-    with open('updates.json') as f:
-        data_dict = json.load(f)
-    
-    data_dict[key]['last_run'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    data_dict[key]['success'] = value
-
-    with open('updates.json', 'w') as f:
-        json.dump(data_dict, f,indent=4)
-
-def load_progress():
-    # Default empty progress dictionary
-    progress_dict = {}
-    
-    # Load data_dict to check for keys
-    with open('data.json') as f:
-        data_dict = json.load(f)
-    
-    # Check if updates.json exists
-    if os.path.exists('updates.json'):
-        with open('updates.json', 'r') as f:
-            progress_dict = json.load(f)
-
-    
-    # Check for missing keys - iterate through all mention types
+from querycache import QueryCache
+from rollups import update_rollups
+from runstate import RunState
+from scheduler import run_concurrently
+from textsearch import TokenBucket
+
+# Mention keys run concurrently, but every search shares one process-wide rate limit.
+# The limiter caps this at the SEC ceiling of 10 requests per second.
+MAX_WORKERS = int(os.environ.get('MENTIONS_MAX_WORKERS', 8))
+REQUESTS_PER_SECOND = float(os.environ.get('SEC_REQUESTS_PER_SECOND', 8.0))
+
+def mention_keys(data_dict):
+    """Every key that records run state: one per mention file, plus the filer metadata refresh."""
+    keys = []
     for category in data_dict['mentions']:
         mentions_dict = data_dict['mentions'][category]
-        
         # Handle nested groups (like tariffs, dei, esg)
         if "query" not in mentions_dict:
-            for key in mentions_dict:
-                if key not in progress_dict:
-                    progress_dict[key] = {
-                        'last_run': None,
-                        'success': False
-                    }
+            keys.extend(mentions_dict)
         else:
-            # Handle direct mention types
-            if category not in progress_dict:
-                progress_dict[category] = {
-                    'last_run': None,
-                    'success': False
-                }
-
-        if "submissions_metadata" not in progress_dict:
-            progress_dict['submissions_metadata'] = {
-                'last_run': None,
-                'success': False
-            }
-    
-    # Write back the updated progress dictionary
-    with open('updates.json', 'w') as f:
-        json.dump(progress_dict, f, indent=4)
-    
-    return progress_dict
-
-    
+            keys.append(category)
+    return keys + ['submissions_metadata']
 
 
-def process_mentions(mentions_dict,start_date,key):
+def process_mentions(mentions_dict,start_date,key,state,limiter=None,base_url=None,cache=None):
+    start = time.monotonic()
     try:
         if start_date is not None:
             start_date = datetime.strptime(start_date.split()[0], "%Y-%m-%d")
 
-        construct_mentions(text_queries=mentions_dict['query'],\
-            file_path=f"data/mentions/{'_'.join(mentions_dict['submission_type'])}/{'_'.join(mentions_dict['document_type'])}/{key}.csv",\
-            start_date=start_date, submission_type=mentions_dict['submission_type'], document_type=mentions_dict['document_type'])
-        
-        save_progress(key, True)
+        file_path = f"data/mentions/{'_'.join(mentions_dict['submission_type'])}/{'_'.join(mentions_dict['document_type'])}/{key}.csv"
+        new_rows = construct_mentions(text_queries=mentions_dict['query'],\
+            file_path=file_path,\
+            start_date=start_date, submission_type=mentions_dict['submission_type'], document_type=mentions_dict['document_type'],\
+            limiter=limiter, base_url=base_url, cache=cache)
+
+        # Parquet copy of the same rows for date range queries; the CSVs stay the compatibility export
+        with span('columnar', key=key):
+            sync_mentions(key, file_path + '.gz', new_rows)
+        # Per day, week, month and quarter counts for dashboards, recounted only where new rows landed
+        with span('rollups', key=key):
+            update_rollups(key, file_path + '.gz', new_rows)
+
+        state.record(key, True, rows=len(new_rows), duration=round(time.monotonic() - start, 3))
+        return new_rows
     except Exception as e:
-        print(e)
+        count('failed_keys')
+        print(f"{key}: {e}")
+        state.record(key, False, duration=round(time.monotonic() - start, 3), error=str(e))
 
-def run_updates():
+def run_updates(max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND, base_url=None):
 
     # Load data_dict
     with open('data.json') as f:
         data_dict = json.load(f)
 
-    # Load updates if exist
-    updates = load_progress()
+    # Per-key state lives in SQLite; updates.json is exported from it at the end of the run
+    state = RunState()
+    state.ensure_keys(mention_keys(data_dict))
+    state.start_run('generate-data')
+    updates = state.all()
 
-    # process mentions
+    # process mentions concurrently under a single shared rate limit
+    limiter = TokenBucket(requests_per_second)
+    cache = QueryCache()
+    jobs = {}
     for mention in data_dict['mentions']:
         mentions_dict = data_dict['mentions'][mention]
-        process_mentions(mentions_dict=mentions_dict, start_date=updates[mention]['last_run'],key=mention)
+        jobs[mention] = partial(process_mentions, mentions_dict=mentions_dict, start_date=updates[mention]['last_run'],
+                                key=mention, state=state, limiter=limiter, base_url=base_url, cache=cache)
+    outcomes = run_concurrently(jobs, max_workers=max_workers)
+    print(f"Processed {len(jobs)} mention keys with {limiter.requests} search requests")
+    print(f"Search cache: {cache.stats['hits']} hits, {cache.stats['misses']} misses, {cache.stats['coalesced']} coalesced")
+    count('search_requests', limiter.requests)
+    for outcome, value in cache.stats.items():
+        count(f'cache_{outcome}', value)
+
+    # CIK -> mentions index across every key, updated once from all keys' new rows
+    try:
+        with span('cik_index'):
+            update_index({key: outcome['result'] for key, outcome in outcomes.items() if outcome['result']})
+    except Exception as e:
+        print(f"CIK index: {e}")
     
     # Process metadata
     try:
-        process_submissions_metadata(output_dir="data/filer_metadata/")
-        save_progress('submissions_metadata', True)
+        # Only filers whose submissions entry changed since the last run are re-parsed
+        previous = updates['submissions_metadata']
+        with span('filer_metadata'):
+            stats = refresh_filer_metadata(output_dir="data/filer_metadata/", watermark=previous.get('zip_watermark'),
+                                           since=previous['last_run'])
+        count('filer_entries_parsed', stats['parsed'])
+        print(f"Filer metadata ({stats['mode']}): parsed {stats['parsed']} of {stats['entries']} entries")
+        state.record('submissions_metadata', True, zip_watermark=stats['watermark'], parsed=stats['parsed'])
+    except Exception as e:
+        print(f"Filer metadata: {e}")
+        state.record('submissions_metadata', False, error=str(e))
+
+    # Rejoin mentions to the refreshed filer metadata
+    try:
+        with span('enrichment'):
+            print(f"Enriched {build_enriched()} mention rows")
+    except Exception as e:
+        print(f"Enrichment: {e}")
+
+    # Hashes, row counts and per-run deltas of every published output, for incremental mirrors
+    try:
+        with span('manifest'):
+            changes = update_manifest()
+        count('changed_outputs', len(changes))
+        print(f"Manifest: {len(changes)} outputs changed")
     except Exception as e:
-        save_progress('submissions_metadata', True)
+        print(f"Manifest: {e}")
+
+    # Slowest keys first, so regressions stand out when comparing nights
+    keys = {key: {'duration': round(outcome['duration'], 3) if outcome['duration'] is not None else None,
+                  'new_rows': len(outcome['result']) if outcome['result'] is not None else None}
+            for key, outcome in sorted(outcomes.items(), key=lambda item: -(item[1]['duration'] or 0))}
+    write_report('generate-data', extra={'keys': keys})
+
+    state.finish_run()
+    state.export()
+    failing = state.failed_keys(runs=3, every=True)
+    if failing:
+        print(f"Failed in each of the last 3 runs: {', '.join(failing)}")
 
     # Create CIK CUSIP Mapping
 
@@ -0,0 +1,139 @@
+"""
+Lightweight run instrumentation: timed spans, counters and peak memory, written out as a JSON run report
+and optionally as a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev).
+
+Entry points record into the module-level recorder:
+
+    with span('search', key=key):
+        ...
+    count('rows', len(rows))
+    write_report('generate-data')
+"""
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_DIR = 'run_reports'
+
+# Set RUN_TRACE=1 to also write a Chrome trace next to each report
+TRACE = os.environ.get('RUN_TRACE', '') not in ('', '0')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its finished child processes, in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {'self': round(own, 1), 'children': round(children, 1)}
+
+
+class Recorder:
+    """Thread-safe collection of spans and counters for one run."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            end = time.perf_counter()
+            record = {'name': name, 'start': start - self.origin, 'duration': end - start,
+                      'pid': os.getpid(), 'tid': threading.get_ident(), 'attrs': attrs}
+            with self.lock:
+                self.spans.append(record)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def export(self):
+        """Spans and counters in a picklable form, for handing back from worker processes."""
+        with self.lock:
+            return {'started': self.started, 'spans': list(self.spans), 'counters': dict(self.counters)}
+
+    def merge(self, exported):
+        """Fold in spans and counters recorded by another recorder, e.g. in a worker process."""
+        # Worker spans are relative to the worker's own origin, so shift them onto this run's timeline
+        offset = exported['started'] - self.started
+        with self.lock:
+            for record in exported['spans']:
+                self.spans.append(dict(record, start=record['start'] + offset))
+            for name, value in exported['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Per span name: count, total, mean and max seconds, plus the slowest instance's attributes."""
+        stages = {}
+        with self.lock:
+            spans = list(self.spans)
+        for record in spans:
+            stage = stages.setdefault(record['name'], {'count': 0, 'total': 0.0, 'max': 0.0, 'slowest': None})
+            stage['count'] += 1
+            stage['total'] += record['duration']
+            if record['duration'] >= stage['max']:
+                stage['max'] = record['duration']
+                stage['slowest'] = record['attrs']
+        for stage in stages.values():
+            stage['mean'] = stage['total'] / stage['count']
+            for field in ('total', 'max', 'mean'):
+                stage[field] = round(stage[field], 4)
+        return stages
+
+    def report(self, name, extra=None):
+        elapsed = time.time() - self.started
+        with self.lock:
+            counters = dict(self.counters)
+            spans = list(self.spans)
+        return {
+            'name': name,
+            'started': datetime.fromtimestamp(self.started).strftime("%Y-%m-%d %H:%M:%S"),
+            'duration': round(elapsed, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'counters': counters,
+            # Every counter as a rate over the whole run, e.g. rows per second
+            'rates': {counter: round(value / elapsed, 3) for counter, value in counters.items()} if elapsed else {},
+            # Individual spans are only written to the trace, which keeps the report small enough to commit
+            'stages': self.summary(),
+            'spans': len(spans),
+            **(extra or {}),
+        }
+
+    def chrome_trace(self):
+        with self.lock:
+            spans = list(self.spans)
+        return {'traceEvents': [{'name': record['name'], 'ph': 'X', 'ts': record['start'] * 1e6,
+                                 'dur': record['duration'] * 1e6, 'pid': record['pid'], 'tid': record['tid'],
+                                 'args': record['attrs']} for record in spans]}
+
+    def write_report(self, name, extra=None, report_dir=REPORT_DIR, trace=TRACE):
+        """
+        Write run_reports/<name>.json, and run_reports/<name>.trace.json when tracing is on.
+
+        Returns:
+            Path of the report
+        """
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, f'{name}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.report(name, extra), f, indent=4, default=str)
+        os.replace(path + '.tmp', path)
+        if trace:
+            with open(os.path.join(report_dir, f'{name}.trace.json'), 'w') as f:
+                json.dump(self.chrome_trace(), f, default=str)
+        print(f"Run report written to {path}")
+        return path
+
+
+recorder = Recorder()
+span = recorder.span
+count = recorder.count
+write_report = recorder.write_report
@@ -0,0 +1,197 @@
+import heapq
+import mmap
+import os
+import re
+import struct
+import sys
+from bisect import bisect_left
+from datetime import date
+
+# Each record packs one (filing_date, cik, accession_number) key into 16 big-endian bytes:
+# accession as filer * 10**8 + year * 10**6 + sequence, then cik, then days since 1970-01-01.
+# Big-endian fields make byte order equal numeric order, so sorted records can be compared as bytes.
+RECORD = struct.Struct('>QII')
+MAGIC = b'DMKIDX01'
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+ACCESSION_PATTERN = re.compile(r'^(\d{10})-(\d{2})-(\d{6})$')
+
+
+def pack_accession(accession_number):
+    """Pack an accession number like 0001410578-24-000124 into a single integer."""
+    m = ACCESSION_PATTERN.match(accession_number)
+    if m is None:
+        raise ValueError(f"Invalid accession number: {accession_number}")
+    return int(m.group(1)) * 10**8 + int(m.group(2)) * 10**6 + int(m.group(3))
+
+
+def unpack_accession(value):
+    filer, rest = divmod(value, 10**8)
+    year, sequence = divmod(rest, 10**6)
+    return f"{filer:010d}-{year:02d}-{sequence:06d}"
+
+
+def pack_date(filing_date):
+    return date.fromisoformat(filing_date).toordinal() - EPOCH_ORDINAL
+
+
+def unpack_date(days):
+    return date.fromordinal(days + EPOCH_ORDINAL).isoformat()
+
+
+def pack_key(key):
+    """Pack a (filing_date, cik, accession_number) tuple of strings into a 16 byte record."""
+    filing_date, cik, accession_number = key
+    return RECORD.pack(pack_accession(accession_number), int(cik), pack_date(filing_date))
+
+
+def unpack_key(record):
+    accession, cik, days = RECORD.unpack(record)
+    return (unpack_date(days), f"{cik:010d}", unpack_accession(accession))
+
+
+class KeyIndex:
+    """
+    Read-only, memory-mapped view of a sorted key index file.
+    Membership checks are binary searches over the mapped records, so nothing is loaded up front.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._mmap = None
+        self._count = 0
+        if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+            self._file = open(path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a key index")
+            self._count = (len(self._mmap) - len(MAGIC)) // RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        offset = len(MAGIC) + i * RECORD.size
+        return self._mmap[offset:offset + RECORD.size]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def __contains__(self, key):
+        record = pack_key(key)
+        i = bisect_left(self, record)
+        return i < self._count and self[i] == record
+
+    def keys(self):
+        """Yield every stored key as a (filing_date, cik, accession_number) tuple of strings."""
+        for record in self:
+            yield unpack_key(record)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _dedup(records):
+    previous = None
+    for record in records:
+        if record != previous:
+            yield record
+            previous = record
+
+
+def merge(path, keys):
+    """
+    Merge keys into the index at path, creating it if needed. The file is replaced atomically.
+
+    Returns:
+        Number of keys that were not already present
+    """
+    new_records = sorted(set(pack_key(key) for key in keys))
+    if not new_records and os.path.exists(path):
+        return 0
+
+    added = 0
+    tmp_path = path + '.tmp'
+    with KeyIndex(path) as existing, open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        count = 0
+        for record in _dedup(heapq.merge(existing, new_records)):
+            f.write(record)
+            count += 1
+        added = count - len(existing)
+    os.replace(tmp_path, path)
+    return added
+
+
+def write(path, keys):
+    """Write a fresh index holding exactly the given keys."""
+    if os.path.exists(path):
+        os.remove(path)
+    merge(path, keys)
+
+
+def _accessions(index):
+    previous = None
+    for record in index:
+        accession = record[:8]
+        if accession != previous:
+            yield accession
+            previous = accession
+
+
+def _count_common(a, b):
+    """Count values present in both sorted iterators."""
+    common = 0
+    a, b = iter(a), iter(b)
+    x, y = next(a, None), next(b, None)
+    while x is not None and y is not None:
+        if x == y:
+            common += 1
+            x, y = next(a, None), next(b, None)
+        elif x < y:
+            x = next(a, None)
+        else:
+            y = next(b, None)
+    return common
+
+
+def overlap(path_a, path_b):
+    """
+    Count rows and filings shared by two mention files, using only their key indexes.
+
+    Returns:
+        Dictionary with 'rows' (identical filing_date, cik, accession keys) and 'accessions' (shared filings)
+    """
+    with KeyIndex(path_a) as a, KeyIndex(path_b) as b:
+        return {
+            'rows': _count_common(a, b),
+            'accessions': _count_common(_accessions(a), _accessions(b)),
+        }
+
+
+if __name__ == "__main__":
+    # Usage: python code/keyindex.py overlap a.idx b.idx [c.idx ...]
+    #        python code/keyindex.py count a.idx [b.idx ...]
+    command, paths = sys.argv[1], sys.argv[2:]
+    if command == 'count':
+        for path in paths:
+            with KeyIndex(path) as index:
+                print(f"{path}: {len(index)} keys")
+    elif command == 'overlap':
+        for i, path_a in enumerate(paths):
+            for path_b in paths[i + 1:]:
+                counts = overlap(path_a, path_b)
+                print(f"{path_a} & {path_b}: {counts['rows']} rows, {counts['accessions']} filings")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
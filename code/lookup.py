@@ -0,0 +1,354 @@
+"""
+Memory-mapped lookups over the identifier crosswalks and dictionaries.
+
+Sources are compiled once into .npy arrays of sorted fixed-width keys (plus row numbers or values) under
+.cache/lookup and opened with mmap, so loading takes milliseconds and worker processes share the pages.
+Every lookup is a batched binary search.
+
+Usage: python code/lookup.py compile
+       python code/lookup.py resolve ID [ID ...]
+       python code/lookup.py serve PORT | unix:PATH
+"""
+import csv
+import glob
+import gzip
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+LOOKUP_DIR = '.cache/lookup'
+FSI_FILENAME = 'data/datasets/financial_security_identifiers_crosswalk.csv.gz'
+CIK_CUSIP_FILENAME = 'data/datasets/cik_cusip_crosswalk.csv.gz'
+DICTIONARY_DIR = 'data/dictionaries'
+
+IDENTIFIER_WIDTHS = {'cusip': 9, 'isin': 12, 'figi': 12}
+
+# Dictionaries listing every CUSIP seen in filings, for find_cusips_dictionary
+CUSIP_DICTIONARIES = ['sc13dg_cusips', '13fhr_information_table_cusips']
+
+
+# How to build each source, for the error raised when its table is missing
+BUILD_COMMANDS = {
+    'fsi': 'python code/financial-security-identifiers/construct-fsi.py',
+    'cik_cusip': 'python code/cik-cusips/construct-cik-cusip-mapping.py',
+}
+
+
+class MissingTableError(KeyError):
+    """A lookup needs a table whose source file has not been built or compiled."""
+    def __str__(self):
+        return self.args[0]
+
+
+def _sources():
+    """Map compiled table name -> source file, for the sources that exist."""
+    sources = {'fsi': FSI_FILENAME, 'cik_cusip': CIK_CUSIP_FILENAME}
+    for path in sorted(glob.glob(os.path.join(DICTIONARY_DIR, '*.txt'))):
+        sources['dictionary.' + os.path.basename(path)[:-len('.txt')]] = path
+    return {name: path for name, path in sources.items() if os.path.exists(path)}
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _save(cache_dir, name, arrays):
+    for array_name, array in arrays.items():
+        path = os.path.join(cache_dir, f'{name}.{array_name}.npy')
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(path + '.tmp', path)
+
+
+def _load(cache_dir, name, array_name):
+    return np.load(os.path.join(cache_dir, f'{name}.{array_name}.npy'), mmap_mode='r')
+
+
+def _sorted_keys(values, width):
+    """Unique, sorted fixed-width byte keys. Values that do not fit the width are dropped."""
+    keys = np.array([value.encode() for value in values if value and len(value.encode()) <= width],
+                    dtype=f'S{width}')
+    return np.unique(keys)
+
+
+def _compile_fsi(path):
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        rows = [row for row in reader]
+    arrays = {}
+    for i, (identifier, width) in enumerate(IDENTIFIER_WIDTHS.items()):
+        column = np.array([row[i].upper().encode() for row in rows], dtype=f'S{width}')
+        arrays[identifier] = column
+        # Sorted keys and the crosswalk row each one belongs to
+        present = np.flatnonzero(column != b'')
+        order = present[np.argsort(column[present], kind='stable')]
+        arrays[f'{identifier}_keys'] = column[order]
+        arrays[f'{identifier}_rows'] = order.astype(np.uint32)
+    return arrays
+
+
+def _compile_cik_cusip(path):
+    pairs = set()
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for _, _, issuer_cik, cusip in reader:
+            if len(cusip) == 9 and issuer_cik.isdigit():
+                pairs.add((cusip.upper(), int(issuer_cik)))
+    pairs = sorted(pairs)
+    return {
+        'keys': np.array([cusip.encode() for cusip, _ in pairs], dtype='S9'),
+        'ciks': np.array([cik for _, cik in pairs], dtype=np.int64),
+    }
+
+
+def _compile_dictionary(path):
+    with open(path, encoding='utf-8') as f:
+        values = [line.strip() for line in f]
+    width = max((len(value.encode()) for value in values), default=1)
+    return {'keys': _sorted_keys(values, width)}
+
+
+def compile_all(cache_dir=LOOKUP_DIR, force=False):
+    """
+    Compile every source whose size or modification time changed since it was last compiled.
+
+    Returns:
+    list: Names of the tables that were compiled
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    compiled = []
+    for name, path in _sources().items():
+        fingerprint = _fingerprint(path)
+        if manifest.get(name, {}).get('source') == fingerprint:
+            continue
+        if name == 'fsi':
+            arrays = _compile_fsi(path)
+        elif name == 'cik_cusip':
+            arrays = _compile_cik_cusip(path)
+        else:
+            arrays = _compile_dictionary(path)
+        _save(cache_dir, name, arrays)
+        manifest[name] = {'source': fingerprint, 'arrays': sorted(arrays)}
+        compiled.append(name)
+
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return compiled
+
+
+def _search(keys, values):
+    """
+    Binary search a batch of values in sorted fixed-width keys.
+
+    Returns:
+    (positions, found) arrays
+    """
+    width = keys.dtype.itemsize
+    encoded = [value.encode() if isinstance(value, str) else value for value in values]
+    fits = np.array([0 < len(value) <= width for value in encoded], dtype=bool)
+    query = np.array([value if ok else b'' for value, ok in zip(encoded, fits)], dtype=keys.dtype)
+    if len(keys) == 0:
+        return np.zeros(len(query), dtype=np.int64), np.zeros(len(query), dtype=bool)
+    positions = np.searchsorted(keys, query)
+    clipped = np.clip(positions, 0, len(keys) - 1)
+    return clipped, fits & (keys[clipped] == query)
+
+
+class Lookup:
+    """
+    Batched lookups over the compiled crosswalks and dictionaries.
+
+    Args:
+        cache_dir: Directory holding the compiled tables
+        compile: Compile missing or stale tables before opening them
+    """
+    def __init__(self, cache_dir=LOOKUP_DIR, compile=True):
+        if compile:
+            compile_all(cache_dir)
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.tables = {name: {array: _load(cache_dir, name, array) for array in entry['arrays']}
+                       for name, entry in manifest.items()}
+        self.dictionaries = sorted(name[len('dictionary.'):] for name in self.tables if name.startswith('dictionary.'))
+
+    def _table(self, name):
+        if name not in self.tables:
+            if name.startswith('dictionary.'):
+                source = os.path.join(DICTIONARY_DIR, name[len('dictionary.'):] + '.txt')
+            else:
+                source = {'fsi': FSI_FILENAME, 'cik_cusip': CIK_CUSIP_FILENAME}[name]
+            build = f"build it with {BUILD_COMMANDS[name]}, then " if name in BUILD_COMMANDS else ''
+            raise MissingTableError(f"Lookup table {name} is not compiled because {source} is missing; "
+                                    f"{build}run python code/lookup.py compile")
+        return self.tables[name]
+
+    def resolve(self, ids):
+        """
+        Resolve CUSIPs, ISINs and FIGIs to their crosswalk entry.
+
+        Args:
+            ids: Sequence of identifiers of any of the three kinds
+
+        Returns:
+            List with a {'cusip', 'isin', 'figi'} dictionary per id (missing identifiers are None),
+            or None where the id is not in the crosswalk
+        """
+        fsi = self._table('fsi')
+        ids = [value.strip().upper() for value in ids]
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        for identifier in IDENTIFIER_WIDTHS:
+            positions, found = _search(fsi[f'{identifier}_keys'], ids)
+            found &= rows < 0
+            rows[found] = fsi[f'{identifier}_rows'][positions[found]]
+
+        results = []
+        for row in rows:
+            if row < 0:
+                results.append(None)
+                continue
+            results.append({identifier: fsi[identifier][row].decode() or None for identifier in IDENTIFIER_WIDTHS})
+        return results
+
+    def issuers(self, cusips):
+        """
+        Issuer CIKs of each CUSIP in the CIK-CUSIP crosswalk.
+
+        Returns:
+            List with a (possibly empty) list of CIKs per CUSIP
+        """
+        table = self._table('cik_cusip')
+        cusips = [value.strip().upper() for value in cusips]
+        query = np.array([value.encode() for value in cusips], dtype='S9')
+        starts = np.searchsorted(table['keys'], query, side='left')
+        ends = np.searchsorted(table['keys'], query, side='right')
+        return [table['ciks'][start:end].tolist() if len(value) == 9 else []
+                for value, start, end in zip(cusips, starts, ends)]
+
+    def contains(self, dictionary, values):
+        """Boolean array marking which values appear in a dictionary, e.g. 'sc13dg_cusips'."""
+        return _search(self._table('dictionary.' + dictionary)['keys'], values)[1]
+
+    def contains_any(self, dictionaries, values):
+        """Boolean array marking which values appear in at least one of the dictionaries."""
+        found = np.zeros(len(values), dtype=bool)
+        for dictionary in dictionaries:
+            found |= self.contains(dictionary, values)
+        return found
+
+    def known_cusips(self, values):
+        """Boolean array marking which values are CUSIPs listed in the CUSIP dictionaries."""
+        return self.contains_any([name for name in CUSIP_DICTIONARIES if name in self.dictionaries], values)
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints over a shared Lookup:
+
+    GET  /resolve?id=...&id=...         POST /resolve with a JSON list of ids
+    GET  /issuers?cusip=...             POST /issuers with a JSON list of CUSIPs
+    GET  /contains/<dictionary>?value=...  POST /contains/<dictionary> with a JSON list of values
+    """
+    lookup = None
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def _respond(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, values):
+        path = urlparse(self.path).path
+        try:
+            if path == '/resolve':
+                self._respond(200, self.lookup.resolve(values))
+            elif path == '/issuers':
+                self._respond(200, self.lookup.issuers(values))
+            elif path.startswith('/contains/'):
+                dictionary = path[len('/contains/'):]
+                if dictionary not in self.lookup.dictionaries:
+                    self._respond(404, {'error': f'Unknown dictionary: {dictionary}'})
+                else:
+                    self._respond(200, self.lookup.contains(dictionary, values).tolist())
+            else:
+                self._respond(404, {'error': f'Unknown path: {path}'})
+        except MissingTableError as e:
+            self._respond(404, {'error': str(e)})
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self._handle(query.get('id', []) + query.get('cusip', []) + query.get('value', []))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            values = json.loads(self.rfile.read(length) or b'[]')
+        except ValueError:
+            self._respond(400, {'error': 'Body must be a JSON list'})
+            return
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            self._respond(400, {'error': 'Body must be a JSON list of strings'})
+            return
+        self._handle(values)
+
+
+class UnixLookupServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(address, lookup=None):
+    """
+    Serve lookups over HTTP until interrupted.
+
+    Args:
+        address: TCP port number, or 'unix:/path/to.sock' for a Unix socket
+        lookup: Lookup to serve, opened from the default cache when None
+    """
+    LookupHandler.lookup = lookup or Lookup()
+    if str(address).startswith('unix:'):
+        path = str(address)[len('unix:'):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = UnixLookupServer(path, LookupHandler)
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', int(address)), LookupHandler)
+    print(f"Serving lookups on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == 'compile':
+        print(f"Compiled: {', '.join(compile_all(force=True))}")
+    elif command == 'resolve':
+        for value, result in zip(sys.argv[2:], Lookup().resolve(sys.argv[2:])):
+            print(f"{value}: {result}")
+    elif command == 'serve':
+        serve(sys.argv[2])
+    else:
+        raise SystemExit(f"Unknown command: {command}")
@@ -0,0 +1,286 @@
+"""
+Manifest and per-run delta files for the published datasets.
+
+data/manifest.json lists every output with its sha256, size, row count, columns, schema version and
+min/max filing_date. Each run that changes outputs also writes data/deltas/<run>/ holding only the rows
+added to each changed output, plus an index.json describing them, so mirrors can sync incrementally:
+
+    for every run in manifest['deltas'] newer than the mirror's last run, apply data/deltas/<run>/index.json;
+    outputs whose delta mode is 'full' (or whose runs were pruned) are downloaded again in full.
+
+Deltas are taken in the cheapest exact way available:
+    append  the file only grew by appended gzip members, so the delta is those tail bytes
+    rows    rows whose hash was not in the previous version, from row hashes cached under .cache/manifest;
+            only used when no row of the previous version was removed, since mirrors just append the delta
+    full    neither is possible (e.g. a new output, a lost cache, or rows removed or rewritten)
+
+Usage: python code/manifest.py update
+"""
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from mentionstore import gzip_member
+
+MANIFEST_FILENAME = 'data/manifest.json'
+DELTA_DIR = 'data/deltas'
+ROW_HASH_DIR = '.cache/manifest'
+OUTPUT_PATTERNS = [
+    'data/mentions/**/*.csv.gz',
+    'data/filer_metadata/*.csv.gz',
+    'data/datasets/*.csv.gz',
+]
+MANIFEST_VERSION = 1
+
+# Older delta runs are deleted; mirrors further behind than this resync in full
+MAX_DELTA_RUNS = 30
+
+
+def output_paths(patterns=OUTPUT_PATTERNS):
+    return sorted({path for pattern in patterns for path in glob.glob(pattern, recursive=True)})
+
+
+def file_digest(path, prefix_size=None):
+    """
+    sha256 of a file, plus the sha256 of its first prefix_size bytes when given.
+
+    Returns:
+        (digest, prefix digest or None)
+    """
+    digest = hashlib.sha256()
+    prefix = None
+    with open(path, 'rb') as f:
+        if prefix_size is not None:
+            remaining = prefix_size
+            while remaining:
+                chunk = f.read(min(1 << 20, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            prefix = digest.hexdigest()
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest(), prefix
+
+
+def row_hash(row):
+    return int.from_bytes(hashlib.blake2b('\x1f'.join(row).encode(), digest_size=8).digest(), 'little')
+
+
+def scan_rows(path):
+    """
+    Read an output once for its statistics.
+
+    Returns:
+        (columns, row count, min filing_date, max filing_date, sorted unique row hashes)
+    """
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        date_column = columns.index('filing_date') if 'filing_date' in columns else None
+        hashes = []
+        min_date = max_date = None
+        for row in reader:
+            hashes.append(row_hash(row))
+            if date_column is not None and len(row) > date_column and row[date_column]:
+                value = row[date_column]
+                if min_date is None or value < min_date:
+                    min_date = value
+                if max_date is None or value > max_date:
+                    max_date = value
+    return columns, len(hashes), min_date, max_date, np.unique(np.array(hashes, dtype=np.uint64))
+
+
+def _row_hash_path(cache_dir, path):
+    return os.path.join(cache_dir, hashlib.sha1(path.encode()).hexdigest())
+
+
+def _save_row_hashes(cache_dir, path, digest, hashes):
+    """Cache the row hashes of the version of path with this sha256, for the next run's row diff."""
+    os.makedirs(cache_dir, exist_ok=True)
+    target = _row_hash_path(cache_dir, path)
+    with open(target + '.tmp', 'wb') as f:
+        np.save(f, hashes)
+    os.replace(target + '.tmp', target + '.npy')
+    with open(target + '.sha256', 'w') as f:
+        f.write(digest)
+
+
+def _load_row_hashes(cache_dir, path, digest):
+    """Cached row hashes of path, only if they were taken from the version with this sha256."""
+    target = _row_hash_path(cache_dir, path)
+    if not os.path.exists(target + '.npy') or not os.path.exists(target + '.sha256'):
+        return None
+    with open(target + '.sha256') as f:
+        if f.read().strip() != digest:
+            return None
+    return np.load(target + '.npy')
+
+
+def _write_rows_delta(path, delta_path, columns, old_hashes):
+    """Write the rows of path whose hash is not among old_hashes. Returns the number of rows written."""
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        rows = list(reader)
+    hashes = np.array([row_hash(row) for row in rows], dtype=np.uint64)
+    added = [row for row, new in zip(rows, ~np.isin(hashes, old_hashes)) if new]
+    with open(delta_path, 'wb') as f:
+        f.write(gzip_member(added, header=columns))
+    return len(added)
+
+
+def _write_append_delta(path, delta_path, columns, offset):
+    """Write a header member followed by the gzip members appended to path after offset."""
+    with open(path, 'rb') as source, open(delta_path, 'wb') as target:
+        target.write(gzip_member([], header=columns))
+        source.seek(offset)
+        shutil.copyfileobj(source, target)
+
+
+def load_manifest(manifest_path=MANIFEST_FILENAME):
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {'version': MANIFEST_VERSION, 'run': None, 'deltas': [], 'outputs': {}}
+
+
+def update_manifest(manifest_path=MANIFEST_FILENAME, delta_dir=DELTA_DIR, cache_dir=ROW_HASH_DIR, paths=None):
+    """
+    Refresh the manifest and write this run's delta files for every output that changed.
+
+    Outputs whose sha256 is unchanged keep their entry untouched, so an unchanged night costs one hash per file
+    and rewrites nothing.
+
+    Returns:
+        Dictionary mapping changed output path -> delta entry (mode, rows, removed, delta path)
+    """
+    manifest = load_manifest(manifest_path)
+    previous = manifest['outputs']
+    paths = output_paths() if paths is None else paths
+    run = datetime.now().strftime("%Y%m%dT%H%M%S")
+    run_dir = os.path.join(delta_dir, run)
+
+    outputs = {}
+    changes = {}
+    for path in paths:
+        old = previous.get(path)
+        size = os.path.getsize(path)
+        grew = old is not None and size > old['size']
+        digest, prefix = file_digest(path, old['size'] if grew else None)
+        if old is not None and digest == old['sha256']:
+            outputs[path] = old
+            continue
+
+        columns, rows, min_date, max_date, hashes = scan_rows(path)
+        schema_version = 1
+        if old is not None:
+            schema_version = old['schema_version'] + (old['columns'] != columns)
+        outputs[path] = {'sha256': digest, 'size': size, 'rows': rows, 'columns': columns,
+                         'schema_version': schema_version, 'min_filing_date': min_date,
+                         'max_filing_date': max_date, 'run': run}
+
+        delta = {'mode': 'full', 'rows': rows, 'removed': None, 'sha256': digest,
+                 'previous_sha256': old['sha256'] if old else None}
+        old_hashes = _load_row_hashes(cache_dir, path, old['sha256']) if old else None
+        appended = old is not None and prefix == old['sha256']
+        # A rows delta can only add rows, so outputs that lost any are sent in full
+        removed = int((~np.isin(old_hashes, hashes)).sum()) if old_hashes is not None and not appended else None
+        if old is not None and old['columns'] == columns and (appended or removed == 0):
+            delta_path = os.path.join(run_dir, os.path.relpath(path, 'data'))
+            os.makedirs(os.path.dirname(delta_path), exist_ok=True)
+            if appended:
+                # Only whole gzip members were appended, so the tail holds exactly the new rows
+                _write_append_delta(path, delta_path, columns, old['size'])
+                delta.update(mode='append', rows=rows - old['rows'], removed=0)
+            else:
+                added = _write_rows_delta(path, delta_path, columns, old_hashes)
+                delta.update(mode='rows', rows=added, removed=0)
+            delta['delta'] = delta_path
+        elif removed:
+            delta['removed'] = removed
+        changes[path] = delta
+        _save_row_hashes(cache_dir, path, digest, hashes)
+
+    if not changes and set(outputs) == set(previous):
+        return {}
+
+    # Outputs that disappeared are listed as removed in this run's index
+    for path in set(previous) - set(outputs):
+        changes[path] = {'mode': 'removed', 'rows': 0, 'removed': previous[path]['rows'], 'sha256': None,
+                         'previous_sha256': previous[path]['sha256']}
+
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, 'index.json'), 'w') as f:
+        json.dump({'run': run, 'previous_run': manifest['run'], 'outputs': changes}, f, indent=4)
+
+    deltas = manifest['deltas'] + [run]
+    for stale in deltas[:-MAX_DELTA_RUNS]:
+        shutil.rmtree(os.path.join(delta_dir, stale), ignore_errors=True)
+
+    manifest = {'version': MANIFEST_VERSION, 'run': run, 'previous_run': manifest['run'],
+                'deltas': deltas[-MAX_DELTA_RUNS:], 'outputs': outputs}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return changes
+
+
+def _content_digest(path, compressed):
+    """sha256 of a file's contents, decompressed for gzip files so the gzip header timestamp is ignored."""
+    digest = hashlib.sha256()
+    opener = gzip.open if compressed else open
+    with opener(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def replace_if_changed(tmp_path, path):
+    """
+    Move tmp_path over path unless both hold the same contents, in which case tmp_path is discarded and
+    path keeps its bytes, so unchanged outputs never show up as rewritten.
+
+    Returns:
+        True if path was replaced
+    """
+    compressed = path.endswith('.gz')
+    if os.path.exists(path) and _content_digest(tmp_path, compressed) == _content_digest(path, compressed):
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+@contextmanager
+def deterministic_gzip(path):
+    """Open path for writing gzip text with a zero header timestamp, so identical rows give identical bytes."""
+    with gzip.GzipFile(path, mode='wb', mtime=0) as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        try:
+            yield text
+        finally:
+            text.flush()
+            text.detach()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == 'update':
+        changes = update_manifest()
+        for path, delta in changes.items():
+            print(f"{path}: {delta['mode']}, {delta['rows']} rows added")
+        print(f"{len(changes)} outputs changed")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
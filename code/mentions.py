@@ -1,14 +1,19 @@
-from datamule.sec.submissions.textsearch import query
-from datetime import datetime
+from textsearch import search
+from mentionstore import load_keys, append_rows, load_checkpoint, save_checkpoint
+from instrumentation import count, span
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 import pytz
-import csv
 import os
-import gzip
 
-def construct_mentions(text_queries, file_path, start_date=None, submission_type=None, document_type=None):
+def construct_mentions(text_queries, file_path, start_date=None, submission_type=None, document_type=None,
+                       limiter=None, base_url=None, cache=None, shard_workers=4):
     """
     Search SEC filings for multiple text queries and write results to a single GZIP-compressed CSV file.
-    Preserves existing data in the file and appends new results.
+    Preserves existing data in the file and appends new results as an extra gzip member.
+
+    The search range is split into calendar month shards fetched in parallel. Each finished shard
+    is appended and checkpointed, so a failed run resumes with only the missing shards.
     
     Parameters:
     text_queries (list): List of text queries to search for (e.g. ["inclusion", "inclusive"])
@@ -16,9 +21,18 @@ def construct_mentions(text_queries, file_path, start_date=None, submission_type
     start_date (str, optional): Start date for search in YYYY-MM-DD format. Defaults to "2001-01-01".
     submission_type (list, optional): Types of submissions to search (e.g. ["10-K", "10-Q"])
     document_type (str, optional): Type of document to filter by, matching the 'form' field (e.g. "10-K")
+    limiter (TokenBucket, optional): Rate limiter shared with other concurrently running searches
+    base_url (str, optional): Override for the full-text search endpoint, e.g. a local stub server
+    cache (QueryCache, optional): Cache shared by searches, so overlapping or repeated searches are not refetched
+    shard_workers (int, optional): Number of month shards fetched at once
+
+    Returns:
+    list: The new rows written by this run
     """
     if start_date is None:
         start_date = "2001-01-01"
+    if hasattr(start_date, 'strftime'):
+        start_date = start_date.strftime("%Y-%m-%d")
     end_date = datetime.now(pytz.timezone("US/Eastern")).strftime("%Y-%m-%d")
     
     # Make sure file path ends with .gz
@@ -29,63 +43,105 @@ def construct_mentions(text_queries, file_path, start_date=None, submission_type
     directory = os.path.dirname(file_path)
     if directory and not os.path.exists(directory):
         os.makedirs(directory)
+
+    # Shards finished by an earlier, interrupted run over the same window are skipped
+    completed = load_checkpoint(file_path, start_date)
+    shards = [shard for shard in month_shards(start_date, end_date) if shard not in completed]
+    if completed:
+        print(f"Resuming {file_path}: {len(completed)} shards already done, {len(shards)} remaining")
+
+    name = os.path.basename(file_path)
+
+    def fetch_shard(shard):
+        with span('search', file=name, shard=shard[0]):
+            return [search(f'{text_query}', filing_date=shard, submission_type=submission_type,
+                           limiter=limiter, base_url=base_url, cache=cache)
+                    for text_query in text_queries]
     
-    # Load existing data if file exists
-    existing_data = []
-    existing_keys = set()
-    
-    if os.path.exists(file_path):
-        print(f"Loading existing data from {file_path}")
-        with gzip.open(file_path, 'rt', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            header = next(reader)  # Skip header row
-            for row in reader:
-                existing_data.append(row)
-                # Use filing_date, cik, and accession_number as key for deduplication
-                existing_keys.add((row[0], row[1], row[2]))
-        print(f"Loaded {len(existing_data)} existing records")
-
-
-    # Process each query and collect results
-    new_results = []
-    
-    for text_query in text_queries:
-        results = query(f'{text_query}', filing_date=(start_date, end_date), 
-                        requests_per_second=4.0, quiet=True, submission_type=submission_type)
-        
-        for result in results:
+    # The key index is only opened once a search returns hits, so an empty night costs nothing
+    existing_keys = None
+    seen_keys = set()
 
-            # Check if document_type filter is applied and matches
+    # Process each shard as it completes, appending its rows before checkpointing it
+    new_results = []
+    errors = []
 
-            if document_type is not None and result['_source'].get('form') not in document_type:
+    with ThreadPoolExecutor(max_workers=shard_workers) as executor:
+        futures = {executor.submit(fetch_shard, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                shard_results = future.result()
+            except Exception as e:
+                print(f"Failed shard {shard[0]} to {shard[1]} for {file_path}: {e}")
+                errors.append(e)
                 continue
-                
-            filing_date = result['_source']['file_date']
-            ciks = result['_source']['ciks']
-            id_parts = result['_id'].split(':')
-            accession_number = id_parts[0]
-            filename = id_parts[1] if len(id_parts) > 1 else ""
-            
-
-            for cik in ciks:
-                # Create a row with the new order: filing_date, cik, accession_number, filename
-                row = [filing_date, cik, accession_number, filename]
-                # Use filing_date, cik, and accession_number for uniqueness check
-                row_key = (filing_date, cik, accession_number)
-                
-                if row_key not in existing_keys:
-                    new_results.append(row)
-                    existing_keys.add(row_key)
+
+            with span('dedup', file=name, shard=shard[0]):
+                shard_rows = []
+                for results in shard_results:
+                    for result in results:
+
+                        # Check if document_type filter is applied and matches
+
+                        if document_type is not None and result['_source'].get('form') not in document_type:
+                            continue
+                        
+                        filing_date = result['_source']['file_date']
+                        ciks = result['_source']['ciks']
+                        id_parts = result['_id'].split(':')
+                        accession_number = id_parts[0]
+                        filename = id_parts[1] if len(id_parts) > 1 else ""
                     
-        print(f"Completed query: '{text_query}'")
-    
-    # Combine existing and new data
-    all_results = existing_data + new_results
-    
-    # Write the combined results to GZIP compressed CSV
-    with gzip.open(file_path, 'wt', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(['filing_date', 'cik', 'accession_number', 'filename'])
-        writer.writerows(all_results)
+                        if existing_keys is None:
+                            with span('load_keys', file=name):
+                                existing_keys = load_keys(file_path)
+
+                        for cik in ciks:
+                            # Create a row with the new order: filing_date, cik, accession_number, filename
+                            row = [filing_date, cik, accession_number, filename]
+                            # Use filing_date, cik, and accession_number for uniqueness check
+                            row_key = (filing_date, cik, accession_number)
+                        
+                            if row_key not in seen_keys and row_key not in existing_keys:
+                                shard_rows.append(row)
+                                seen_keys.add(row_key)
+
+            # Append only the new rows, leaving existing data untouched
+            with span('append', file=name, shard=shard[0], rows=len(shard_rows)):
+                append_rows(file_path, shard_rows)
+            count('mention_rows', len(shard_rows))
+            new_results.extend(shard_rows)
+
+            completed.add(shard)
+            save_checkpoint(file_path, start_date, completed)
+
+    if existing_keys is not None:
+        existing_keys.close()
+
+    if errors:
+        print(f"Appended {len(new_results)} new results to {file_path}, {len(errors)} shards failed")
+        raise errors[0]
+
+    # Every shard is done, so the next run starts from a fresh window
+    save_checkpoint(file_path, start_date, set())
     
-    print(f"Wrote {len(all_results)} total results ({len(new_results)} new) to {file_path} (GZIP compressed)")
\ No newline at end of file
+    print(f"Appended {len(new_results)} new results to {file_path} (GZIP compressed)")
+    return new_results
+
+
+def month_shards(start_date, end_date):
+    """
+    Split a YYYY-MM-DD date range into calendar month windows.
+    Month boundaries are fixed, so overlapping ranges share shards and cached searches.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+
+    shards = []
+    while start <= end:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        shard_end = min(end, next_month - timedelta(days=1))
+        shards.append((start.strftime("%Y-%m-%d"), shard_end.strftime("%Y-%m-%d")))
+        start = next_month
+    return shards
@@ -0,0 +1,201 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+
+import keyindex
+
+HEADER = ['filing_date', 'cik', 'accession_number', 'filename']
+
+# Key indexes and storage state of the mention files, rebuilt from the CSVs when the cache is lost
+SIDECAR_DIR = '.cache/mentions'
+
+# Appended gzip members are folded back into a single member once there are this many
+MAX_MEMBERS = 30
+
+
+def _sidecar_path(file_path, extension):
+    """
+    Derived state of a mention file lives under SIDECAR_DIR rather than next to the published CSV, named after
+    the file and a hash of its absolute path so files with the same name in different folders never collide.
+    """
+    absolute = os.path.abspath(file_path)
+    name = os.path.basename(absolute)
+    if name.endswith('.csv.gz'):
+        name = name[:-len('.csv.gz')]
+    digest = hashlib.sha1(absolute.encode()).hexdigest()[:16]
+    os.makedirs(SIDECAR_DIR, exist_ok=True)
+    return os.path.join(SIDECAR_DIR, f'{name}-{digest}{extension}')
+
+
+def state_path(file_path):
+    return _sidecar_path(file_path, '.state.json')
+
+
+def index_path(file_path):
+    return _sidecar_path(file_path, '.idx')
+
+
+def _read_state(file_path):
+    path = state_path(file_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'rows': 0, 'members': 0}
+
+
+def load_state(file_path):
+    """
+    Load the storage state of a mention file. The state records the size of the CSV it describes, so when it
+    or the key index is missing (a cache miss) or stale, both are rebuilt from the CSV.
+    """
+    state = _read_state(file_path)
+    if os.path.exists(file_path) and (state.get('size') != os.path.getsize(file_path)
+                                      or not os.path.exists(index_path(file_path))):
+        rebuild_index(file_path)
+        state = _read_state(file_path)
+    return state
+
+
+def save_state(file_path, state):
+    if os.path.exists(file_path):
+        state['size'] = os.path.getsize(file_path)
+    path = state_path(file_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _remove_legacy_sidecars(file_path):
+    """Delete sidecars left next to the CSV by earlier versions, so they drop out of the published tree."""
+    base = file_path[:-len('.csv.gz')] if file_path.endswith('.csv.gz') else file_path
+    for extension in ('.idx', '.idx.tmp', '.state.json', '.state.json.tmp'):
+        if os.path.exists(base + extension):
+            os.remove(base + extension)
+
+
+def gzip_member(rows, header=None):
+    """Encode rows as a standalone gzip member. Concatenated members read back as one CSV."""
+    buffer = io.BytesIO()
+    # mtime=0 keeps the output byte-identical for identical rows
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as gz:
+        text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        if header is not None:
+            writer.writerow(header)
+        writer.writerows(rows)
+        text.flush()
+        text.detach()
+    return buffer.getvalue()
+
+
+def iter_rows(file_path):
+    """Yield data rows from a mention file without loading it into memory."""
+    with gzip.open(file_path, 'rt', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)  # Skip header row
+        for row in reader:
+            yield row
+
+
+def rebuild_index(file_path):
+    """
+    Rebuild the dedup key index from the CSV. Only needed once per file, or after it is lost.
+
+    Returns:
+        Number of data rows in the file
+    """
+    print(f"Building key index for {file_path}")
+    _remove_legacy_sidecars(file_path)
+    keys = [tuple(row[:3]) for row in iter_rows(file_path)]
+    keyindex.write(index_path(file_path), keys)
+    count = len(keys)
+
+    state = _read_state(file_path)
+    state['rows'] = count
+    state['members'] = max(state['members'], 1)
+    save_state(file_path, state)
+    return count
+
+
+def load_keys(file_path):
+    """
+    Open the (filing_date, cik, accession_number) key index of a mention file.
+    The index is memory-mapped, so membership checks do not read the whole history.
+    """
+    # Loading the state rebuilds a missing or stale index
+    load_state(file_path)
+    return keyindex.KeyIndex(index_path(file_path))
+
+
+def append_rows(file_path, rows):
+    """
+    Append rows to a mention file as a new gzip member, without rewriting existing data.
+    Compacts the file once it accumulates more than MAX_MEMBERS members.
+    """
+    if not rows:
+        return
+
+    state = load_state(file_path)
+    if not os.path.exists(file_path):
+        member = gzip_member(rows, header=HEADER)
+        state = {'rows': 0, 'members': 0}
+    else:
+        member = gzip_member(rows)
+
+    size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    with open(file_path, 'ab') as f:
+        try:
+            f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        except Exception:
+            # Never leave a partial member behind
+            f.truncate(size)
+            raise
+
+    keyindex.merge(index_path(file_path), [tuple(row[:3]) for row in rows])
+
+    state['rows'] += len(rows)
+    state['members'] += 1
+    save_state(file_path, state)
+
+    if state['members'] > MAX_MEMBERS:
+        compact(file_path)
+
+
+def compact(file_path):
+    """Rewrite a mention file as a single gzip member, streaming so memory stays flat."""
+    tmp_path = file_path + '.tmp'
+    with gzip.open(file_path, 'rb') as source, open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(tmp_path, file_path)
+
+    state = load_state(file_path)
+    state['members'] = 1
+    save_state(file_path, state)
+    print(f"Compacted {file_path}")
+
+
+def load_checkpoint(file_path, start_date):
+    """Return the date shards already completed by an interrupted run that started at start_date."""
+    checkpoint = load_state(file_path).get('checkpoint')
+    if checkpoint is None or checkpoint['start_date'] != start_date:
+        return set()
+    return set(tuple(shard) for shard in checkpoint['completed'])
+
+
+def save_checkpoint(file_path, start_date, completed):
+    state = load_state(file_path)
+    if completed:
+        state['checkpoint'] = {'start_date': start_date, 'completed': sorted(completed)}
+    elif 'checkpoint' in state:
+        del state['checkpoint']
+    else:
+        return
+    save_state(file_path, state)
@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+CACHE_DIR = '.cache/textsearch'
+
+# Windows ending this many days ago or later may still gain filings, so they expire quickly
+SETTLE_DAYS = 7
+
+
+def _format_date(value):
+    if hasattr(value, 'strftime'):
+        return value.strftime("%Y-%m-%d")
+    return str(value).split()[0]
+
+
+class QueryCache:
+    """
+    On-disk cache of full-text search results keyed by (query, submission types, date window).
+
+    Identical searches issued concurrently are coalesced: the first caller fetches and the
+    others wait for its result. Entries for recent windows expire after ttl seconds, settled
+    windows after closed_ttl. The least recently used entries are evicted above max_bytes.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, ttl=12 * 3600, closed_ttl=30 * 24 * 3600, max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.closed_ttl = closed_ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, text_query, filing_date, submission_type=None, base_url=None):
+        start_date, end_date = (_format_date(d) for d in filing_date)
+        types = sorted(submission_type) if isinstance(submission_type, list) else submission_type
+        payload = json.dumps([text_query, types, start_date, end_date, base_url])
+        return hashlib.sha256(payload.encode()).hexdigest(), end_date
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json.gz')
+
+    def _expires_after(self, end_date):
+        settled = datetime.now() - timedelta(days=SETTLE_DAYS)
+        if datetime.strptime(end_date, "%Y-%m-%d") < settled:
+            return self.closed_ttl
+        return self.ttl
+
+    def get(self, key, end_date):
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['created'] > self._expires_after(end_date):
+            os.remove(path)
+            return None
+        # Access time drives LRU eviction
+        os.utime(path)
+        return entry['hits']
+
+    def put(self, key, hits):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt') as f:
+            json.dump({'created': time.time(), 'hits': hits}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json.gz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def fetch(self, key, end_date, fetch):
+        """Return cached hits for key, calling fetch() at most once across concurrent callers."""
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            hits = self.get(key, end_date)
+            outcome = 'hits' if hits is not None else 'misses'
+            if hits is None:
+                hits = fetch()
+                self.put(key, hits)
+            with self.lock:
+                self.stats[outcome] += 1
+            future.set_result(hits)
+            return hits
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
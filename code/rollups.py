@@ -0,0 +1,169 @@
+import csv
+import glob
+import os
+import sys
+
+import numpy as np
+
+from keyindex import MAGIC, unpack_date
+from mentionstore import index_path, load_keys, load_state
+
+ROLLUP_DIR = 'data/rollups'
+HEADER = ['period', 'rows', 'ciks', 'accessions']
+
+# Index records as stored on disk, see keyindex.RECORD
+RECORD_DTYPE = np.dtype([('accession', '>u8'), ('cik', '>u4'), ('days', '>u4')])
+
+
+def _week(days):
+    # 1970-01-01 was a Thursday, weeks start on Monday
+    return days - (days + 3) % 7
+
+
+def _month(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def _month_label(month):
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+
+def _quarter_label(quarter):
+    return f"{1970 + quarter // 4}-Q{quarter % 4 + 1}"
+
+
+# Period id of each record and the label it is written under
+PERIODS = {
+    'daily': (lambda days: days, unpack_date),
+    'weekly': (_week, unpack_date),
+    'monthly': (_month, _month_label),
+    'quarterly': (lambda days: _month(days) // 3, _quarter_label),
+}
+
+
+def rollup_path(period, key, root=ROLLUP_DIR):
+    return os.path.join(root, period, f'{key}.csv')
+
+
+def load_records(file_path):
+    """Load the key index of a mention file as a structured array of accession, cik and days."""
+    load_keys(file_path).close()
+    path = index_path(file_path)
+    if os.path.getsize(path) <= len(MAGIC):
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.fromfile(path, dtype=RECORD_DTYPE, offset=len(MAGIC))
+
+
+def _distinct_counts(periods, values):
+    """Count distinct values per period id. Returns (period ids, counts)."""
+    pairs = np.unique(np.stack([periods.astype(np.uint64), values.astype(np.uint64)]), axis=1)
+    return np.unique(pairs[0], return_counts=True)
+
+
+def _read_rollup(path):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        return {row[0]: [int(value) for value in row[1:]] for row in reader}
+
+
+def _write_rollup(path, table):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for period in sorted(table):
+            writer.writerow([period] + table[period])
+    os.replace(path + '.tmp', path)
+
+
+def _count_daily(records, days):
+    """Rows, distinct CIKs and distinct accessions for each day id in days."""
+    selected = records[np.isin(records['days'], days)]
+    table = {}
+    ids, rows = np.unique(selected['days'], return_counts=True)
+    for i, count in zip(ids, rows):
+        table[int(i)] = [int(count), 0, 0]
+    for column, position in (('cik', 1), ('accession', 2)):
+        for i, count in zip(*_distinct_counts(selected['days'], selected[column])):
+            table[int(i)][position] = int(count)
+    return table
+
+
+def update_rollups(key, file_path, new_rows, root=ROLLUP_DIR):
+    """
+    Maintain per-day, week, month and quarter mention counts for one key.
+
+    Only the days that new_rows fall on, and the periods containing them, are recounted from the key index.
+    Weekly, monthly and quarterly rows and accessions are summed from the daily table, since a filing has a
+    single filing date. Distinct CIKs cannot be summed, so they are counted from the index for touched periods.
+    If the daily table does not account for every row of the mention file, every period is recounted.
+
+    Parameters:
+    key (str): Mention key
+    file_path (str): The key's .csv.gz mention file, after new_rows were appended
+    new_rows (list): Rows appended by construct_mentions in this run
+    """
+    daily_path = rollup_path('daily', key, root)
+    daily = _read_rollup(daily_path) if os.path.exists(daily_path) else None
+    if daily is not None and not new_rows:
+        return
+
+    records = load_records(file_path)
+    day_ids = records['days'].astype(np.int64)
+    total = load_state(file_path)['rows']
+    full = daily is None or sum(row[0] for row in daily.values()) + len(new_rows) != total
+    if full:
+        print(f"Rebuilding rollups for {key}")
+        daily = {}
+        touched_days = np.unique(day_ids)
+    else:
+        touched_days = np.unique([(np.datetime64(row[0], 'D') - np.datetime64(0, 'D')).astype(np.int64)
+                                  for row in new_rows])
+
+    for day, counts in _count_daily(records, touched_days).items():
+        daily[unpack_date(day)] = counts
+    _write_rollup(daily_path, daily)
+
+    daily_days = np.array([(np.datetime64(day, 'D') - np.datetime64(0, 'D')).astype(np.int64) for day in daily],
+                          dtype=np.int64)
+    daily_counts = list(daily.values())
+    for period, (period_id, label) in PERIODS.items():
+        if period == 'daily':
+            continue
+        path = rollup_path(period, key, root)
+        table = {} if full or not os.path.exists(path) else _read_rollup(path)
+        touched = np.unique(period_id(touched_days if table else day_ids))
+
+        # Rows and accessions from the daily table
+        sums = {}
+        for i, counts in zip(period_id(daily_days), daily_counts):
+            if i in sums:
+                sums[i][0] += counts[0]
+                sums[i][2] += counts[2]
+            else:
+                sums[i] = [counts[0], 0, counts[2]]
+
+        # Distinct CIKs from the index
+        record_periods = period_id(day_ids)
+        mask = np.isin(record_periods, touched)
+        for i, count in zip(*_distinct_counts(record_periods[mask], records['cik'][mask])):
+            sums[int(i)][1] = int(count)
+
+        for i in touched:
+            table[label(int(i))] = sums[int(i)]
+        _write_rollup(path, table)
+
+
+if __name__ == "__main__":
+    # Usage: python code/rollups.py rebuild     recount every key under data/mentions
+    command = sys.argv[1]
+    if command == 'rebuild':
+        for csv_path in sorted(glob.glob('data/mentions/*/*/*.csv.gz')):
+            key = os.path.basename(csv_path)[:-len('.csv.gz')]
+            for period in PERIODS:
+                if os.path.exists(rollup_path(period, key)):
+                    os.remove(rollup_path(period, key))
+            update_rollups(key, csv_path, [])
+    else:
+        raise SystemExit(f"Unknown command: {command}")
@@ -0,0 +1,239 @@
+"""
+Run state for the nightly updates, kept in SQLite (WAL mode) instead of rewriting updates.json per key.
+
+Every key records its latest state (last_run, success, rows, duration, error and extra fields such as the
+filer metadata watermark) plus one history row per run, each update in its own transaction, so concurrent
+workers never overwrite each other and a crash never leaves a half-written file. updates.json is written as
+an export at the end of each run, and seeds the database when the cache that holds it is lost.
+
+Usage: python code/runstate.py export
+       python code/runstate.py failed [RUNS]
+       python code/runstate.py history KEY
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+STATE_DB = '.cache/updates.db'
+EXPORT_FILENAME = 'updates.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    started TEXT NOT NULL,
+    finished TEXT
+);
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    last_run TEXT,
+    success INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER,
+    duration REAL,
+    error TEXT,
+    fields TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS history (
+    run_id INTEGER REFERENCES runs(run_id),
+    key TEXT NOT NULL,
+    recorded TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    rows INTEGER,
+    duration REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS history_key ON history (key, run_id);
+CREATE INDEX IF NOT EXISTS history_run ON history (run_id);
+"""
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class RunState:
+    """
+    Per-key run state shared by the threads of one process. Other processes can open the same database;
+    SQLite serialises their writes.
+
+    Args:
+        path: SQLite database file
+        export_path: updates.json, used to seed keys that are missing or older in the database
+    """
+    def __init__(self, path=STATE_DB, export_path=EXPORT_FILENAME):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.export_path = export_path
+        self.run_id = None
+        self.lock = threading.Lock()
+        # Autocommit mode, with explicit transactions around every update
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode a crash can lose the last commit but never corrupts the database
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        if export_path and os.path.exists(export_path):
+            self.bootstrap(export_path)
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so read-modify-write updates are atomic
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def _query(self, sql, params=()):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def bootstrap(self, export_path):
+        """
+        Import keys from an updates.json export that the database lacks, or holds an older run of.
+
+        Returns:
+            Number of keys imported
+        """
+        with open(export_path) as f:
+            exported = json.load(f)
+        imported = 0
+        with self._transaction() as connection:
+            current = {row['key']: row['last_run'] for row in connection.execute('SELECT key, last_run FROM keys')}
+            for key, entry in exported.items():
+                if key in current and (current[key] or '') >= (entry.get('last_run') or ''):
+                    continue
+                fields = {name: value for name, value in entry.items()
+                          if name not in ('last_run', 'success', 'rows', 'duration', 'error')}
+                connection.execute(
+                    'INSERT OR REPLACE INTO keys (key, last_run, success, rows, duration, error, fields) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, entry.get('last_run'), int(bool(entry.get('success'))), entry.get('rows'),
+                     entry.get('duration'), entry.get('error'), json.dumps(fields)))
+                imported += 1
+        return imported
+
+    def ensure_keys(self, keys):
+        """Add keys that have never run, with no last_run and success False."""
+        with self._transaction() as connection:
+            connection.executemany('INSERT OR IGNORE INTO keys (key) VALUES (?)', [(key,) for key in keys])
+
+    def start_run(self, name):
+        """Open a run; history rows recorded until finish_run belong to it."""
+        with self._transaction() as connection:
+            self.run_id = connection.execute('INSERT INTO runs (name, started) VALUES (?, ?)',
+                                             (name, _now())).lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        with self._transaction() as connection:
+            connection.execute('UPDATE runs SET finished = ? WHERE run_id = ?', (_now(), self.run_id))
+
+    def record(self, key, success, rows=None, duration=None, error=None, **fields):
+        """
+        Record the outcome of one key in a single transaction.
+
+        last_run only advances on success, since it is where the next search starts from. Extra fields are
+        merged into the key's existing fields.
+        """
+        now = _now()
+        with self._transaction() as connection:
+            row = connection.execute('SELECT fields FROM keys WHERE key = ?', (key,)).fetchone()
+            merged = json.loads(row['fields']) if row else {}
+            merged.update(fields)
+            connection.execute(
+                'INSERT INTO keys (key, last_run, success, rows, duration, error, fields) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'last_run = CASE WHEN excluded.success THEN excluded.last_run ELSE keys.last_run END, '
+                'success = excluded.success, rows = excluded.rows, duration = excluded.duration, '
+                'error = excluded.error, fields = excluded.fields',
+                (key, now if success else None, int(bool(success)), rows, duration, error, json.dumps(merged)))
+            connection.execute(
+                'INSERT INTO history (run_id, key, recorded, success, rows, duration, error) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.run_id, key, now, int(bool(success)), rows, duration, error))
+
+    def _entry(self, row):
+        entry = {'last_run': row['last_run'], 'success': bool(row['success'])}
+        for name in ('rows', 'duration', 'error'):
+            if row[name] is not None:
+                entry[name] = row[name]
+        entry.update(json.loads(row['fields']))
+        return entry
+
+    def get(self, key):
+        """State of one key in the updates.json format, or None for an unknown key."""
+        rows = self._query('SELECT * FROM keys WHERE key = ?', (key,))
+        return self._entry(rows[0]) if rows else None
+
+    def all(self):
+        """Dictionary mapping key -> state, in the updates.json format."""
+        return {row['key']: self._entry(row) for row in self._query('SELECT * FROM keys ORDER BY rowid')}
+
+    def history(self, key, limit=10):
+        """Most recent outcomes of a key, newest first."""
+        rows = self._query('SELECT run_id, recorded, success, rows, duration, error FROM history '
+                           'WHERE key = ? ORDER BY recorded DESC, rowid DESC LIMIT ?', (key, limit))
+        return [dict(row, success=bool(row['success'])) for row in rows]
+
+    def failed_keys(self, runs=3, every=False):
+        """
+        Keys that failed in the last runs runs.
+
+        Args:
+            runs: Number of most recent runs to look at
+            every: Only keys that failed in every one of those runs, rather than in any of them. Nothing is
+                returned until there have been runs runs.
+
+        Returns:
+            Dictionary mapping key -> number of failed runs, most failures first
+        """
+        if every and self.run_count() < runs:
+            return {}
+        rows = self._query(
+            'SELECT key, COUNT(DISTINCT run_id) AS failures FROM history '
+            'WHERE success = 0 AND run_id IN (SELECT run_id FROM runs ORDER BY run_id DESC LIMIT ?) '
+            'GROUP BY key HAVING failures >= ? ORDER BY failures DESC, key',
+            (runs, runs if every else 1))
+        return {row['key']: row['failures'] for row in rows}
+
+    def run_count(self):
+        return self._query('SELECT COUNT(*) AS runs FROM runs')[0]['runs']
+
+    def export(self, path=None):
+        """Write every key's state to updates.json, atomically."""
+        path = path or self.export_path
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.all(), f, indent=4)
+        os.replace(tmp_path, path)
+        return path
+
+    def close(self):
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    state = RunState()
+    if command == 'export':
+        print(f"Exported {len(state.all())} keys to {state.export()}")
+    elif command == 'failed':
+        runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+        for key, failures in state.failed_keys(runs).items():
+            print(f"{key}: failed in {failures} of the last {runs} runs")
+    elif command == 'history':
+        for entry in state.history(sys.argv[2]):
+            print(entry)
+    else:
+        raise SystemExit(f"Unknown command: {command}")
@@ -0,0 +1,33 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def run_concurrently(jobs, max_workers=8):
+    """
+    Run independent jobs on a thread pool. A failing job never stops the others.
+
+    Args:
+        jobs: Dictionary mapping key -> zero-argument callable
+        max_workers: Number of jobs allowed to run at once
+
+    Returns:
+        Dictionary mapping key -> {'result', 'error', 'duration'}
+    """
+    outcomes = {}
+
+    def timed(job):
+        start = time.monotonic()
+        return job(), time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(timed, job): key for key, job in jobs.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result, duration = future.result()
+                outcomes[key] = {'result': result, 'error': None, 'duration': duration}
+            except Exception as e:
+                print(f"{key} failed: {e}")
+                outcomes[key] = {'result': None, 'error': e, 'duration': None}
+
+    return outcomes
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+from datamule.sec.submissions.textsearch import TextSearchEFTSQuery
+
+# SEC fair access policy: no more than 10 requests per second per client
+SEC_MAX_REQUESTS_PER_SECOND = 10.0
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by every full-text search in the process.
+
+    Safe to use from multiple threads, each running its own event loop. Callers
+    reserve a slot under a lock and then sleep outside of it, so waiting never
+    blocks other reservations.
+    """
+    def __init__(self, rate, capacity=1.0, max_rate=SEC_MAX_REQUESTS_PER_SECOND):
+        self.rate = min(rate, max_rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def _reserve(self):
+        """Take one token and return how long the caller must wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            self.requests += 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait_time = self._reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return True
+
+    async def __aenter__(self):
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+def search(text_query, filing_date, submission_type=None, limiter=None, base_url=None, quiet=True, cache=None):
+    """
+    Run a full-text search, returning the same hits as datamule's textsearch.query.
+
+    Parameters:
+    text_query (str): Full-text search query
+    filing_date (tuple): (start_date, end_date) in YYYY-MM-DD format
+    submission_type (list, optional): Types of submissions to search (e.g. ["10-K", "10-Q"])
+    limiter (TokenBucket, optional): Shared rate limiter. Defaults to a private 4 requests/second limiter.
+    base_url (str, optional): Override for the EFTS endpoint, e.g. a local stub server
+    quiet (bool, optional): Suppress datamule progress output
+    cache (QueryCache, optional): Result cache. Identical concurrent searches are fetched once.
+    """
+    if cache is not None:
+        key, end_date = cache.make_key(text_query, filing_date, submission_type, base_url)
+        return cache.fetch(key, end_date, lambda: search(text_query, filing_date, submission_type,
+                                                         limiter=limiter, base_url=base_url, quiet=quiet))
+
+    async def run_query():
+        efts_query = TextSearchEFTSQuery(text_query, requests_per_second=4.0, quiet=quiet)
+        if limiter is not None:
+            efts_query.limiter = limiter
+        if base_url is not None:
+            efts_query.base_url = base_url
+        return await efts_query.query(None, submission_type, filing_date, None, None, None)
+
+    return asyncio.run(run_query())
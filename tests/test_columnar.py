@@ -0,0 +1,39 @@
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+import columnar
+import mentionstore
+
+
+def mention_rows(start, n):
+    return [[f'2024-01-{1 + i % 28:02d}', str(320193 + i), f'0000320193-24-{i:06d}', 'ex99.htm']
+            for i in range(start, start + n)]
+
+
+def test_sync_mentions_rebuilds_after_interrupted_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'MAX_PARTS', 2)
+    monkeypatch.setattr(mentionstore, 'SIDECAR_DIR', str(tmp_path / 'sidecars'))
+    csv_path = str(tmp_path / 'mentions.csv.gz')
+    root = str(tmp_path / 'columnar')
+    partition = os.path.join(root, 'key=test')
+
+    for start in range(0, 4, 2):
+        rows = mention_rows(start, 2)
+        mentionstore.append_rows(csv_path, rows)
+        columnar.sync_mentions('test', csv_path, rows, root)
+
+    # Crash after the compacted file replaced part-00000 but before the superseded parts were removed
+    rows = mention_rows(4, 2)
+    mentionstore.append_rows(csv_path, rows)
+    columnar._write_part(partition, columnar.to_table(rows))
+    kept = os.path.join(str(tmp_path), 'part-00001.parquet')
+    shutil.copyfile(os.path.join(partition, 'part-00001.parquet'), kept)
+    columnar.compact_partition(partition)
+    shutil.copyfile(kept, os.path.join(partition, 'part-00001.parquet'))
+    assert columnar.read_mentions('test', root=root).num_rows == 8
+
+    # Even a sync without new rows notices the duplicated rows and rebuilds
+    columnar.sync_mentions('test', csv_path, [], root)
+    assert columnar.read_mentions('test', root=root).num_rows == 6
@@ -0,0 +1,53 @@
+import csv
+import gzip
+import importlib.util
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code')
+sys.path.insert(0, os.path.join(CODE_DIR, 'cik-cusips'))
+
+spec = importlib.util.spec_from_file_location(
+    'construct_cik_cusip_mapping', os.path.join(CODE_DIR, 'cik-cusips', 'construct-cik-cusip-mapping.py'))
+mapping = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mapping)
+
+
+def read_rows(path):
+    with gzip.open(path, 'rt', newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_build_crosswalk_extends_yyyymmdd_crosswalk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data/datasets')
+    output_filename = 'data/datasets/cik_cusip_crosswalk.csv.gz'
+    with gzip.open(output_filename, 'wt', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(mapping.HEADER)
+        writer.writerow(['0000320193-24-000001', '20240105', '320193', '037833100'])
+
+    months = []
+
+    def process_month(start_date, end_date, shard_path, skip_accessions, dictionary_scan=False):
+        months.append((start_date, skip_accessions))
+        rows = [('0000320193-24-000002', '20240108', '320193', '037833100')] if len(months) == 1 else []
+        with gzip.open(shard_path, 'wt', newline='') as f:
+            csv.writer(f, quoting=csv.QUOTE_ALL).writerows(rows)
+        return len(rows), 0, {}, mapping.Recorder().export()
+
+    # Months run on threads so the stubbed month processing is used
+    monkeypatch.setattr(mapping, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(mapping, 'process_month', process_month)
+
+    mapping.build_crosswalk(output_filename, max_workers=1)
+    assert months[0] == ('2024-01-05', {'0000320193-24-000001'})
+    assert read_rows(output_filename)[1:] == [['0000320193-24-000001', '20240105', '320193', '037833100'],
+                                              ['0000320193-24-000002', '20240108', '320193', '037833100']]
+
+    # The second run resumes from the newly appended filing date
+    months.clear()
+    mapping.build_crosswalk(output_filename, max_workers=1)
+    assert months[0] == ('2024-01-08', {'0000320193-24-000002'})
+    assert len(read_rows(output_filename)) == 4
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+import lookup
+
+
+def test_issuers_without_crosswalk_names_the_missing_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    table = lookup.Lookup()
+    with pytest.raises(lookup.MissingTableError, match='cik_cusip_crosswalk.csv.gz is missing'):
+        table.issuers(['037833100'])
@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+import mentionstore
+
+
+def test_sidecars_live_in_cache_and_are_rebuilt_on_a_miss(tmp_path, monkeypatch):
+    sidecar_dir = tmp_path / 'cache'
+    monkeypatch.setattr(mentionstore, 'SIDECAR_DIR', str(sidecar_dir))
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    file_path = str(data_dir / 'key.csv.gz')
+    rows = [['2024-01-02', '320193', f'0000320193-24-{i:06d}', 'ex99.htm'] for i in range(3)]
+
+    mentionstore.append_rows(file_path, rows[:2])
+    assert os.listdir(data_dir) == ['key.csv.gz']
+
+    # Lost cache: state and index come back from the CSV
+    shutil.rmtree(sidecar_dir)
+    assert mentionstore.load_state(file_path)['rows'] == 2
+    mentionstore.append_rows(file_path, rows[2:])
+    keys = mentionstore.load_keys(file_path)
+    try:
+        assert all(tuple(row[:3]) in keys for row in rows)
+    finally:
+        keys.close()
+    assert mentionstore.load_state(file_path)['rows'] == 3
+
+    # A cache restored from before the last append is stale and rebuilt as well
+    stale = str(tmp_path / 'stale')
+    shutil.copytree(sidecar_dir, stale)
+    mentionstore.append_rows(file_path, [['2024-01-03', '320193', '0000320193-24-000009', 'ex99.htm']])
+    shutil.rmtree(sidecar_dir)
+    shutil.copytree(stale, sidecar_dir)
+    assert mentionstore.load_state(file_path)['rows'] == 4
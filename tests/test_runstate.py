@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from runstate import RunState
+
+
+def test_failed_keys_every_requires_that_many_runs(tmp_path):
+    state = RunState(str(tmp_path / 'updates.db'), export_path=None)
+    for run in range(3):
+        state.start_run('test')
+        state.record('always', False, error='boom')
+        state.record('once', run != 0, error=None if run else 'boom')
+        state.finish_run()
+        if run < 2:
+            assert state.failed_keys(runs=3, every=True) == {}
+
+    assert state.failed_keys(runs=3, every=True) == {'always': 3}
+    assert state.failed_keys(runs=3) == {'always': 3, 'once': 1}
+    state.close()